@@ -0,0 +1,205 @@
+import json
+from collections import defaultdict
+from datetime import datetime
+from flask import Blueprint, Response, request, abort
+from sqlalchemy.orm import load_only
+from models import db, Venue, Artist, Show, Genre, venue_genre, artist_genre
+from pagination import paginate_request
+from queries import filter_by_genre, split_shows
+
+#----------------------------------------------------------------------------#
+# JSON API
+#----------------------------------------------------------------------------#
+
+# Read-only JSON mirror of the venue, artist and show pages. Every endpoint
+# takes ?fields= with a comma separated subset of its fields and only selects
+# the columns (and runs the genre / show queries) those fields need.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# API field name -> model attribute
+VENUE_FIELDS = {
+  'id': 'id',
+  'name': 'name',
+  'area_id': 'area_id',
+  'city': 'city',
+  'state': 'state',
+  'address': 'address',
+  'phone': 'phone',
+  'image_link': 'image_link',
+  'facebook_link': 'facebook_link',
+  'website_link': 'website_link',
+  'seeking_talent': 'looking_for_talent',
+  'seeking_description': 'seeking_description',
+  'upcoming_shows_count': 'upcoming_show_count',
+  'past_shows_count': 'past_show_count',
+}
+ARTIST_FIELDS = {
+  'id': 'id',
+  'name': 'name',
+  'area_id': 'area_id',
+  'city': 'city',
+  'state': 'state',
+  'phone': 'phone',
+  'image_link': 'image_link',
+  'facebook_link': 'facebook_link',
+  'website_link': 'website_link',
+  'seeking_venue': 'looking_for_venues',
+  'seeking_description': 'seeking_description',
+  'upcoming_shows_count': 'upcoming_show_count',
+  'past_shows_count': 'past_show_count',
+}
+SHOW_FIELDS = {
+  'id': Show.id,
+  'start_time': Show.start_time,
+  'venue_id': Show.venue_id,
+  'venue_name': Venue.name,
+  'artist_id': Show.artist_id,
+  'artist_name': Artist.name,
+  'artist_image_link': Artist.image_link,
+}
+DETAIL_FIELDS = ['genres', 'past_shows', 'upcoming_shows']
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+def json_response(data, status=200):
+    # compact encoding regardless of JSONIFY_PRETTYPRINT_REGULAR, with an
+    # ETag so clients can revalidate and get an empty 304 back
+    body = json.dumps(data, separators=(',', ':'), default=_default)
+    response = Response(body, status, mimetype='application/json')
+    if status == 200:
+        response.add_etag()
+        response.make_conditional(request)
+    return response
+
+def requested_fields(available, default):
+    fields = request.args.get('fields')
+    if not fields:
+        return list(default)
+    fields = list(dict.fromkeys(f.strip() for f in fields.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        abort(json_response({'error': 'unknown fields: ' + ', '.join(unknown)}, 400))
+    return fields
+
+def genre_names(model, association, owner_ids):
+    # {owner id: [genre names]} for a whole page of owners in one query
+    owner_id = association.c[model.__tablename__.lower() + '_id']
+    names = defaultdict(list)
+    rows = db.session.query(owner_id, Genre.name)\
+      .join(Genre, Genre.id == association.c.genre_id)\
+      .filter(owner_id.in_(owner_ids))\
+      .order_by(Genre.name)
+    for id, name in rows:
+        names[id].append(name)
+    return names
+
+def _owner_query(model, attributes, fields, keys=()):
+    # city and state come from the Area row joined in by the area relationship
+    columns = {attributes[f] for f in fields if f in attributes and attributes[f] in model.__table__.c}
+    return db.session.query(model).options(load_only(*columns | {'id'} | set(keys)))
+
+def _serialize(obj, attributes, fields, genres=None):
+    data = {f: getattr(obj, attributes[f]) for f in fields if f in attributes}
+    if 'genres' in fields:
+        data['genres'] = genres.get(obj.id, [])
+    return data
+
+def _list_owners(model, attributes, association, default):
+    fields = requested_fields(list(attributes) + ['genres'], default)
+    query = filter_by_genre(_owner_query(model, attributes, fields, ['name']),
+      model, association, request.args.get('genre'))
+    page = paginate_request(query, [model.name, model.id])
+    genres = genre_names(model, association, [o.id for o in page]) if 'genres' in fields else None
+    return json_response({
+      'data': [_serialize(o, attributes, fields, genres) for o in page],
+      'next': page.next_cursor,
+      'prev': page.prev_cursor
+    })
+
+def _show_owner(model, attributes, association, owner_id, other):
+    fields = requested_fields(list(attributes) + DETAIL_FIELDS, list(attributes) + DETAIL_FIELDS)
+    obj = _owner_query(model, attributes, fields).filter(model.id == owner_id).first()
+    if obj is None:
+        abort(404)
+    genres = genre_names(model, association, [obj.id]) if 'genres' in fields else None
+    data = _serialize(obj, attributes, fields, genres)
+
+    if 'past_shows' in fields or 'upcoming_shows' in fields:
+        now = datetime.now()
+        fk = Show.venue_id if model is Venue else Show.artist_id
+        prefix = other.__tablename__.lower()
+        rows = db.session.query(
+            Show.start_time,
+            other.id.label(prefix + '_id'),
+            other.name.label(prefix + '_name'),
+            other.image_link.label(prefix + '_image_link')
+          )\
+          .join(other, other.id == getattr(Show, prefix + '_id'))\
+          .filter(fk == owner_id)\
+          .order_by(Show.start_time, Show.id).all()
+        past, upcoming = split_shows(rows, now)
+        for name, shows in (('past_shows', past), ('upcoming_shows', upcoming)):
+            if name in fields:
+                data[name] = [dict(s._mapping) for s in shows]
+    return json_response(data)
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+@db.read_only
+def venues():
+    return _list_owners(Venue, VENUE_FIELDS, venue_genre, ['id', 'name', 'city', 'state'])
+
+@api.route('/venues/<int:venue_id>')
+@db.read_only
+def show_venue(venue_id):
+    return _show_owner(Venue, VENUE_FIELDS, venue_genre, venue_id, Artist)
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/artists')
+@db.read_only
+def artists():
+    return _list_owners(Artist, ARTIST_FIELDS, artist_genre, ['id', 'name'])
+
+@api.route('/artists/<int:artist_id>')
+@db.read_only
+def show_artist(artist_id):
+    return _show_owner(Artist, ARTIST_FIELDS, artist_genre, artist_id, Venue)
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/shows')
+@db.read_only
+def shows():
+    fields = requested_fields(SHOW_FIELDS, SHOW_FIELDS)
+    # select the sort key plus the requested columns, joining artists and
+    # venues only when one of their columns was asked for
+    columns = [SHOW_FIELDS[f].label(f) for f in fields if f not in ('id', 'start_time')]
+    query = db.session.query(Show.id, Show.start_time, *columns)
+    if {'artist_name', 'artist_image_link'} & set(fields):
+        query = query.join(Artist, Artist.id == Show.artist_id)
+    if 'venue_name' in fields:
+        query = query.join(Venue, Venue.id == Show.venue_id)
+    page = paginate_request(query, [Show.start_time, Show.id])
+    return json_response({
+      'data': [{f: getattr(s, f) for f in fields} for s in page],
+      'next': page.next_cursor,
+      'prev': page.prev_cursor
+    })
+
+@api.errorhandler(400)
+def bad_request_error(error):
+    return json_response({'error': error.description}, 400)
+
+@api.errorhandler(404)
+def not_found_error(error):
+    return json_response({'error': 'not found'}, 404)
@@ -4,9 +4,11 @@
 
 import json
 from datetime import datetime
+from functools import lru_cache
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify
+import babel.dates
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort
 from flask_migrate import Migrate
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
@@ -16,18 +18,44 @@ from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from models import *
+from queries import venue_directory, genres_by_name, filter_by_genre, area_by_name, area_members, \
+  venue_shows_query, artist_shows_query, split_shows
+from counters import record_show, delete_shows, rollover_scheduler
+from search import venue_search, artist_search
+from pagination import paginate_request, PAGE_PARAMS
+import query_plans
+from cache import response_cache
+from connection_pool import pool_stats
+from conditional import conditional, listing_state, venue_state, artist_state, bump_table_versions
+from loading import load_profile
+import importer
+import exporter
+from api import api
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+@lru_cache(maxsize=None)
+def compiled_datetime_format(format, locale):
+  # parsing a Babel pattern is far more expensive than applying it
+  return babel.dates.parse_pattern(format), babel.Locale.parse(locale)
+
+@lru_cache(maxsize=4096)
+def _format_datetime(value, format, locale):
+  pattern, locale = compiled_datetime_format(format, locale)
+  return pattern.apply(value, locale)
+
+def format_datetime(value, format='medium', locale='en'):
+  # views pass datetime objects, strings are still parsed for other callers
+  if isinstance(value, str):
+      value = dateutil.parser.parse(value)
+  return _format_datetime(value, DATETIME_FORMATS.get(format, format), locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -43,92 +71,80 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@db.read_only
+@conditional(lambda: listing_state(Venue))
+@response_cache.cached('venues', params=PAGE_PARAMS + ('genre',))
 def venues():
-  # list all venues
-  city_state_combinbations = db.session.query(func.count(Venue.id), Venue.city, Venue.state)\
-    .group_by(Venue.city, Venue.state).all()
-
-  data = []
-  # loop through all available locations and prepare the respective venue data
-  for c in city_state_combinbations:
-      venues = db.session.query(Venue).filter(Venue.city == c.city, Venue.state == c.state)
-
-      # get info about all venues in a location
-      venue_data = []
-      for v in venues:
-          num_upcoming_shows = len(db.session.query(Show)\
-            .filter(Show.venue_id == v.id, Show.start_time > datetime.now()).all())
-          venue_data.append({
-            'id': v.id,
-            'name': v.name,
-            'num_upcoming_shows': num_upcoming_shows
-          })
-
-      data.append({
-        'city': c.city,
-        'state': c.state,
-        'venues': venue_data
-      })
-
-  return render_template('pages/venues.html', areas=data);
+  # list one page of venues grouped by city and state, optionally by genre
+  genre = request.args.get('genre')
+  data, page = venue_directory(genre)
+  return render_template('pages/venues.html', areas=data, page=page, genre=genre);
 
 @app.route('/venues/search', methods=['POST'])
+@db.read_only
 def search_venues():
   search_term = request.form.get('search_term', '')
-  matching_venues = db.session.query(Venue).filter(Venue.name.ilike("%{}%".format(search_term))).all()
+  # one result past the page tells whether there are more
+  limit = app.config['PAGE_SIZE']
+  matching_venues = venue_search.query(search_term, Venue.id, Venue.name, Venue.upcoming_show_count,
+    limit=limit + 1)
 
   # prepare response data
   data = []
-  for v in matching_venues:
-      num_upcoming_shows = len(db.session.query(Show)\
-        .filter(Show.venue_id == v.id, Show.start_time > datetime.now()).all())
+  for v in matching_venues[:limit]:
       data.append({
         'id': v.id,
         'name': v.name,
-        'num_upcoming_shows': num_upcoming_shows
+        'num_upcoming_shows': v.upcoming_show_count
       })
 
   response={
     "count": len(data),
+    "more": len(matching_venues) > limit,
     "data": data
   }
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
+@db.read_only
+@conditional(venue_state)
+@response_cache.cached('venue:{venue_id}')
+@load_profile(selectin=[Venue.genres])
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  venue = Venue.query.get(venue_id)
-  past_shows = db.session.query(Show, Artist)\
-    .join(Artist, Artist.id == Show.artist_id)\
-    .filter(Show.venue_id == venue_id, Show.start_time <= datetime.now()).all()
-  upcoming_shows = db.session.query(Show, Artist)\
-    .join(Artist, Artist.id == Show.artist_id)\
-    .filter(Show.venue_id == venue_id, Show.start_time > datetime.now()).all()
+  now = datetime.now()
+  rows = venue_shows_query(venue_id, now).all()
+  if not rows:
+      abort(404)
+  venue = rows[0].Venue
+  past_shows, upcoming_shows = split_shows(rows, now)
+  response_cache.tag(*{'artist:{}'.format(r.artist_id) for r in rows if r.artist_id})
 
   # prepare show data
   past_shows_list = []
-  for s, a in past_shows:
+  for s in past_shows:
       past_shows_list.append({
-        'artist_id': a.id,
-        'artist_name': a.name,
-        'artist_image_link': a.image_link,
-        'start_time': s.start_time.strftime("%d/%m/%Y, %H:%M")
+        'artist_id': s.artist_id,
+        'artist_name': s.artist_name,
+        'artist_image_link': s.artist_image_link,
+        'start_time': s.start_time
       })
   upcoming_shows_list = []
-  for s, a in upcoming_shows:
+  for s in upcoming_shows:
       upcoming_shows_list.append({
-        'artist_id': a.id,
-        'artist_name': a.name,
-        'artist_image_link': a.image_link,
-        'start_time': s.start_time.strftime("%d/%m/%Y, %H:%M")
+        'artist_id': s.artist_id,
+        'artist_name': s.artist_name,
+        'artist_image_link': s.artist_image_link,
+        'start_time': s.start_time
       })
 
   # combine all data
   data = {
     'id': venue_id,
     'name': venue.name,
-    'genres': venue.genres.split(', '),
+    'genres': [g.name for g in venue.genres],
     'address': venue.address,
+    'area_id': venue.area_id,
     'city': venue.city,
     'state': venue.state,
     'phone': venue.phone,
@@ -139,8 +155,8 @@ def show_venue(venue_id):
     'image_link': venue.image_link,
     'past_shows': past_shows_list,
     'upcoming_shows': upcoming_shows_list,
-    'past_shows_count': len(past_shows),
-    'upcoming_shows_count': len(upcoming_shows)
+    'past_shows_count': rows[0].past_shows_count,
+    'upcoming_shows_count': rows[0].upcoming_shows_count
   }
 
   return render_template('pages/show_venue.html', venue=data)
@@ -166,11 +182,10 @@ def create_venue_submission():
   try:
       new_venue = Venue(
         name = form.name.data,
-        city = form.city.data,
-        state = form.state.data,
+        area = area_by_name(form.city.data, form.state.data),
         address = form.address.data,
         phone = form.phone.data,
-        genres = ', '.join(form.genres.data),
+        genres = genres_by_name(form.genres.data),
         image_link = form.image_link.data,
         facebook_link = form.facebook_link.data,
         website_link = form.website_link.data,
@@ -179,6 +194,8 @@ def create_venue_submission():
       )
       db.session.add(new_venue)
       db.session.commit()
+      venue_search.refresh(new_venue.id)
+      response_cache.invalidate('venues')
       # on successful db insert, flash success
       flash('Venue ' + form.name.data + ' was successfully listed!')
   except:
@@ -196,8 +213,13 @@ def delete_venue(venue_id):
   venue_name = db.session.query(Venue.name).filter(Venue.id == venue_id).first().name
 
   try:
+    delete_shows(venue_id=venue_id)
+    db.session.execute(venue_genre.delete().where(venue_genre.c.venue_id == venue_id))
     Venue.query.filter_by(id=venue_id).delete()
+    bump_table_versions(Venue)
     db.session.commit()
+    venue_search.discard(venue_id)
+    response_cache.invalidate('venues', 'venue:{}'.format(venue_id))
     flash('Venue ' + venue_name + ' was successfully deleted!')
   except:
     db.session.rollback()
@@ -207,71 +229,99 @@ def delete_venue(venue_id):
 
   return jsonify({ 'success': True })
 
+#  Areas
+#  ----------------------------------------------------------------
+
+@app.route('/areas/<int:area_id>')
+@db.read_only
+@conditional(lambda area_id: listing_state(Venue, Artist))
+@response_cache.cached('venues', 'artists', params=PAGE_PARAMS + ('members',))
+def show_area(area_id):
+  # list one page of the venues, or with ?members=artists the artists, of
+  # one city
+  area = Area.query.get_or_404(area_id)
+  members = 'artists' if request.args.get('members') == 'artists' else 'venues'
+  page = area_members(area_id, Artist if members == 'artists' else Venue)
+  return render_template('pages/show_area.html', area=area, members=members, items=page.items, page=page)
+
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@db.read_only
+@conditional(lambda: listing_state(Artist))
+@response_cache.cached('artists', params=PAGE_PARAMS + ('genre',))
 def artists():
-  # list all artists
-  data = db.session.query(Artist.id, Artist.name).all()
-  return render_template('pages/artists.html', artists=data)
+  # list one page of artists ordered by name, optionally by genre
+  genre = request.args.get('genre')
+  query = filter_by_genre(db.session.query(Artist.id, Artist.name), Artist, artist_genre, genre)
+  page = paginate_request(query, [Artist.name, Artist.id])
+  return render_template('pages/artists.html', artists=page.items, page=page, genre=genre)
 
 @app.route('/artists/search', methods=['POST'])
+@db.read_only
 def search_artists():
   search_term = request.form.get('search_term', '')
-  matching_artists = db.session.query(Artist).filter(Artist.name.ilike("%{}%".format(search_term))).all()
+  # one result past the page tells whether there are more
+  limit = app.config['PAGE_SIZE']
+  matching_artists = artist_search.query(search_term, Artist.id, Artist.name, Artist.upcoming_show_count,
+    limit=limit + 1)
 
   # prepare response data
   data = []
-  for a in matching_artists:
-      num_upcoming_shows = len(db.session.query(Show)\
-        .filter(Show.artist_id == a.id, Show.start_time > datetime.now()).all())
+  for a in matching_artists[:limit]:
       data.append({
         'id': a.id,
         'name': a.name,
-        'num_upcoming_shows': num_upcoming_shows
+        'num_upcoming_shows': a.upcoming_show_count
       })
 
   response={
     "count": len(data),
+    "more": len(matching_artists) > limit,
     "data": data
   }
 
   return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
+@db.read_only
+@conditional(artist_state)
+@response_cache.cached('artist:{artist_id}')
+@load_profile(selectin=[Artist.genres])
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
-  artist = Artist.query.get(artist_id)
-  past_shows = db.session.query(Show, Venue)\
-    .join(Venue, Venue.id == Show.venue_id)\
-    .filter(Show.artist_id == artist_id, Show.start_time <= datetime.now()).all()
-  upcoming_shows = db.session.query(Show, Venue)\
-    .join(Venue, Venue.id == Show.venue_id)\
-    .filter(Show.artist_id == artist_id, Show.start_time > datetime.now()).all()
+  now = datetime.now()
+  rows = artist_shows_query(artist_id, now).all()
+  if not rows:
+      abort(404)
+  artist = rows[0].Artist
+  past_shows, upcoming_shows = split_shows(rows, now)
+  response_cache.tag(*{'venue:{}'.format(r.venue_id) for r in rows if r.venue_id})
 
   # prepare show data
   past_shows_list = []
-  for s, v in past_shows:
+  for s in past_shows:
       past_shows_list.append({
-        'venue_id': v.id,
-        'venue_name': v.name,
-        'venue_image_link': v.image_link,
-        'start_time': s.start_time.strftime("%d/%m/%Y, %H:%M")
+        'venue_id': s.venue_id,
+        'venue_name': s.venue_name,
+        'venue_image_link': s.venue_image_link,
+        'start_time': s.start_time
       })
   upcoming_shows_list = []
-  for s, v in upcoming_shows:
+  for s in upcoming_shows:
       upcoming_shows_list.append({
-        'venue_id': v.id,
-        'venue_name': v.name,
-        'venue_image_link': v.image_link,
-        'start_time': s.start_time.strftime("%d/%m/%Y, %H:%M")
+        'venue_id': s.venue_id,
+        'venue_name': s.venue_name,
+        'venue_image_link': s.venue_image_link,
+        'start_time': s.start_time
       })
 
   # combine all data
   data = {
     'id': artist_id,
     'name': artist.name,
-    'genres': artist.genres.split(', '),
+    'genres': [g.name for g in artist.genres],
+    'area_id': artist.area_id,
     'city': artist.city,
     'state': artist.state,
     'phone': artist.phone,
@@ -282,8 +332,8 @@ def show_artist(artist_id):
     'image_link': artist.image_link,
     'past_shows': past_shows_list,
     'upcoming_shows': upcoming_shows_list,
-    'past_shows_count': len(past_shows),
-    'upcoming_shows_count': len(upcoming_shows)
+    'past_shows_count': rows[0].past_shows_count,
+    'upcoming_shows_count': rows[0].upcoming_shows_count
   }
 
   return render_template('pages/show_artist.html', artist=data)
@@ -291,16 +341,16 @@ def show_artist(artist_id):
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@load_profile(selectin=[Artist.genres])
 def edit_artist(artist_id):
   # pre-populate editing form with artist information
   artist = Artist.query.get(artist_id)
-  artist.genres = artist.genres.split(', ')
   form = ArtistForm(
     name = artist.name,
     city = artist.city,
     state = artist.state,
     phone = artist.phone,
-    genres = artist.genres,
+    genres = [g.name for g in artist.genres],
     facebook_link = artist.facebook_link,
     image_link = artist.image_link,
     website_link = artist.website_link,
@@ -311,6 +361,7 @@ def edit_artist(artist_id):
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@load_profile(selectin=[Artist.genres])
 def edit_artist_submission(artist_id):
   # update artist on form submission
   form = ArtistForm(request.form, meta={'csrf': False})
@@ -321,17 +372,20 @@ def edit_artist_submission(artist_id):
       return render_template('forms/edit_artist.html', form=form, artist=artist)
   try:
       artist.name = form.name.data
-      artist.city = form.city.data
-      artist.state = form.state.data
+      artist.area = area_by_name(form.city.data, form.state.data)
       artist.phone = form.phone.data
-      artist.genres = ', '.join(form.genres.data)
+      artist.genres = genres_by_name(form.genres.data)
       artist.image_link = form.image_link.data
       artist.facebook_link = form.facebook_link.data
       artist.website_link = form.website_link.data
       artist.looking_for_venues = form.seeking_venue.data
       artist.seeking_description = form.seeking_description.data
+      # genres alone do not update the row, bump it for the conditional GETs
+      artist.last_modified = utcnow()
 
       db.session.commit()
+      artist_search.refresh(artist_id)
+      response_cache.invalidate('artists', 'artist:{}'.format(artist_id))
       flash('Artist ' + form.name.data + ' was successfully updated!')
   except:
       db.session.rollback()
@@ -342,17 +396,17 @@ def edit_artist_submission(artist_id):
   return redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@load_profile(selectin=[Venue.genres])
 def edit_venue(venue_id):
   # pre-populate editing form with venue information
   venue = Venue.query.get(venue_id)
-  venue.genres = venue.genres.split(', ')
   form = VenueForm(
     name = venue.name,
     city = venue.city,
     state = venue.state,
     address = venue.address,
     phone = venue.phone,
-    genres = venue.genres,
+    genres = [g.name for g in venue.genres],
     facebook_link = venue.facebook_link,
     image_link = venue.image_link,
     website_link = venue.website_link,
@@ -363,6 +417,7 @@ def edit_venue(venue_id):
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@load_profile(selectin=[Venue.genres])
 def edit_venue_submission(venue_id):
   # update venue on form submission
   form = VenueForm(request.form, meta={'csrf': False})
@@ -373,18 +428,21 @@ def edit_venue_submission(venue_id):
       return render_template('forms/edit_venue.html', form=form, venue=venue)
   try:
       venue.name = form.name.data
-      venue.city = form.city.data
-      venue.state = form.state.data
+      venue.area = area_by_name(form.city.data, form.state.data)
       venue.address = form.address.data
       venue.phone = form.phone.data
-      venue.genres = ', '.join(form.genres.data)
+      venue.genres = genres_by_name(form.genres.data)
       venue.image_link = form.image_link.data
       venue.facebook_link = form.facebook_link.data
       venue.website_link = form.website_link.data
       venue.looking_for_talent = form.seeking_talent.data
       venue.seeking_description = form.seeking_description.data
+      # genres alone do not update the row, bump it for the conditional GETs
+      venue.last_modified = utcnow()
 
       db.session.commit()
+      venue_search.refresh(venue_id)
+      response_cache.invalidate('venues', 'venue:{}'.format(venue_id))
       flash('Venue ' + form.name.data + ' was successfully updated!')
   except:
       db.session.rollback()
@@ -415,10 +473,9 @@ def create_artist_submission():
   try:
       new_artist = Artist(
         name = form.name.data,
-        city = form.city.data,
-        state = form.state.data,
+        area = area_by_name(form.city.data, form.state.data),
         phone = form.phone.data,
-        genres = ', '.join(form.genres.data),
+        genres = genres_by_name(form.genres.data),
         image_link = form.image_link.data,
         facebook_link = form.facebook_link.data,
         website_link = form.website_link.data,
@@ -427,6 +484,8 @@ def create_artist_submission():
       )
       db.session.add(new_artist)
       db.session.commit()
+      artist_search.refresh(new_artist.id)
+      response_cache.invalidate('artists')
       # on successful db insert, flash success
       flash('Artist ' + form.name.data + ' was successfully listed!')
   except:
@@ -443,25 +502,37 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@db.read_only
+@conditional(lambda: listing_state(Show, Venue, Artist))
+@response_cache.cached('shows', 'venues', 'artists', params=PAGE_PARAMS)
 def shows():
-  # displays list of shows at /shows
-  shows = db.session.query(Show, Artist, Venue)\
+  # displays one page of shows at /shows ordered by start time
+  query = db.session.query(
+      Show.id,
+      Show.start_time,
+      Show.venue_id,
+      Venue.name.label('venue_name'),
+      Show.artist_id,
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link')
+    )\
     .join(Artist, Artist.id == Show.artist_id)\
-    .join(Venue, Venue.id == Show.venue_id).all()
+    .join(Venue, Venue.id == Show.venue_id)
+  page = paginate_request(query, [Show.start_time, Show.id])
 
   # organize data
   data = []
-  for s, a, v in shows:
+  for s in page.items:
       data.append({
-        'venue_id': v.id,
-        'venue_name': v.name,
-        'artist_id': a.id,
-        'artist_name': a.name,
-        'artist_image_link': a.image_link,
-        'start_time': s.start_time.strftime("%d/%m/%Y, %H:%M")
+        'venue_id': s.venue_id,
+        'venue_name': s.venue_name,
+        'artist_id': s.artist_id,
+        'artist_name': s.artist_name,
+        'artist_image_link': s.artist_image_link,
+        'start_time': s.start_time
       })
 
-  return render_template('pages/shows.html', shows=data)
+  return render_template('pages/shows.html', shows=data, page=page)
 
 @app.route('/shows/create')
 def create_shows():
@@ -486,7 +557,12 @@ def create_show_submission():
         venue_id = form.venue_id.data
       )
       db.session.add(new_show)
+      record_show(new_show)
       db.session.commit()
+      response_cache.invalidate('shows', 'venues',
+        'venue:{}'.format(form.venue_id.data), 'artist:{}'.format(form.artist_id.data))
+      # the new show may start before the one the rollover thread waits for
+      rollover_scheduler.wake()
       # on successful db insert, flash success
       flash('Show was successfully listed!')
   except:
@@ -498,6 +574,22 @@ def create_show_submission():
 
   return render_template('pages/home.html')
 
+#  Stats
+#  ----------------------------------------------------------------
+
+@app.route('/cache/stats')
+def cache_stats():
+  return jsonify(response_cache.stats)
+
+@app.route('/pool/stats')
+def connection_pool_stats():
+  return jsonify(pool_stats(db.engine))
+
+#  JSON API
+#  ----------------------------------------------------------------
+
+app.register_blueprint(api)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,260 @@
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+import config
+
+#----------------------------------------------------------------------------#
+# Benchmark
+#----------------------------------------------------------------------------#
+
+# Seeds a throwaway database, drives every route of the app through the Flask
+# test client and reports latency percentiles, queries and peak allocations
+# per request. Results can be saved as a baseline and later runs compared
+# against it, exiting with status 1 on a regression:
+#
+#   python benchmark.py --save-baseline
+#   python benchmark.py --database postgresql:///fyyur_bench --shows 100000
+#
+# The database is dropped and recreated, so it must not be the one the app
+# is configured with.
+
+GENRES = ['Blues', 'Classical', 'Country', 'Folk', 'Funk', 'Hip-Hop', 'Jazz', 'Pop', 'Rock n Roll', 'Soul']
+AREAS = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Seattle', 'WA'), ('Chicago', 'IL')]
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+
+def load_app(database):
+    # config is read when models is first imported, so override it first
+    config.SQLALCHEMY_DATABASE_URI = database
+    config.DEBUG = False
+    # undeclared relationship loads raise instead of adding queries
+    config.TESTING = True
+    config.CHECK_QUERY_PLANS = False
+    config.CACHE_BACKEND = 'null'
+    config.INSTRUMENT_QUERIES = False
+    config.SHOW_ROLLOVER_THREAD = False
+    return importlib.import_module('app')
+
+
+def seed(db, venues, artists, shows, seed=0):
+    from models import Area, Venue, Artist, Show, Genre, venue_genre, artist_genre
+    from counters import rollover_show_counters
+
+    rnd = random.Random(seed)
+    db.drop_all()
+    db.create_all()
+
+    def insert(table, rows):
+        # an executemany without rows would insert one row of defaults
+        if rows:
+            db.session.execute(table.insert(), rows)
+
+    insert(Genre.__table__, [{'name': g} for g in GENRES])
+    insert(Area.__table__, [{'city': c, 'state': s} for c, s in AREAS])
+
+    def owners(model, association, count):
+        rows, links = [], []
+        owner = model.__tablename__.lower() + '_id'
+        for id in range(1, count + 1):
+            row = {'name': '{} {}'.format(model.__name__, id), 'area_id': rnd.randint(1, len(AREAS))}
+            if model is Venue:
+                row['address'] = '{} Main Street'.format(id)
+            rows.append(row)
+            links.extend({owner: id, 'genre_id': g} for g in rnd.sample(range(1, len(GENRES) + 1), 2))
+        insert(model.__table__, rows)
+        insert(association, links)
+
+    owners(Venue, venue_genre, venues)
+    owners(Artist, artist_genre, artists)
+    now = datetime.now()
+    insert(Show.__table__, [{
+      'start_time': now + timedelta(hours=rnd.randint(-24 * 365, 24 * 365)),
+      'artist_id': rnd.randint(1, artists),
+      'venue_id': rnd.randint(1, venues)
+    } for _ in range(shows)])
+    rollover_show_counters(now=now)
+    db.session.commit()
+    db.session.close()
+
+#----------------------------------------------------------------------------#
+# Routes
+#----------------------------------------------------------------------------#
+
+def routes(venues, artists, requests):
+    # (name, method, url(i), form data(i)) for request number i; writes use
+    # fresh names, and deletes remove the venues at the end of the id range
+    # so they never hit a venue another route reads
+    venue = lambda i: 1 + i % (venues - requests)
+    artist = lambda i: 1 + i % artists
+    start = (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+    owner_form = lambda name: {'name': name, 'city': 'Austin', 'state': 'TX', 'address': '1 Main Street',
+      'genres': ['Jazz', 'Folk']}
+    return [
+      ('home', 'GET', lambda i: '/', None),
+      ('venues', 'GET', lambda i: '/venues', None),
+      ('show area', 'GET', lambda i: '/areas/{}'.format(1 + i % len(AREAS)), None),
+      ('search venues', 'POST', lambda i: '/venues/search', lambda i: {'search_term': 'venue 1'}),
+      ('show venue', 'GET', lambda i: '/venues/{}'.format(venue(i)), None),
+      ('create venue form', 'GET', lambda i: '/venues/create', None),
+      ('create venue', 'POST', lambda i: '/venues/create', lambda i: owner_form('New Venue {}'.format(i))),
+      ('edit venue form', 'GET', lambda i: '/venues/{}/edit'.format(venue(i)), None),
+      ('edit venue', 'POST', lambda i: '/venues/{}/edit'.format(venue(i)),
+        lambda i: owner_form('Venue {}'.format(venue(i)))),
+      ('delete venue', 'DELETE', lambda i: '/venues/{}'.format(venues - i), None),
+      ('artists', 'GET', lambda i: '/artists', None),
+      ('search artists', 'POST', lambda i: '/artists/search', lambda i: {'search_term': 'artist 1'}),
+      ('show artist', 'GET', lambda i: '/artists/{}'.format(artist(i)), None),
+      ('create artist form', 'GET', lambda i: '/artists/create', None),
+      ('create artist', 'POST', lambda i: '/artists/create', lambda i: owner_form('New Artist {}'.format(i))),
+      ('edit artist form', 'GET', lambda i: '/artists/{}/edit'.format(artist(i)), None),
+      ('edit artist', 'POST', lambda i: '/artists/{}/edit'.format(artist(i)),
+        lambda i: owner_form('Artist {}'.format(artist(i)))),
+      ('shows', 'GET', lambda i: '/shows', None),
+      ('create show form', 'GET', lambda i: '/shows/create', None),
+      ('create show', 'POST', lambda i: '/shows/create',
+        lambda i: {'artist_id': str(artist(i)), 'venue_id': str(venue(i)), 'start_time': start}),
+      ('api venues', 'GET', lambda i: '/api/v1/venues', None),
+      ('api venue', 'GET', lambda i: '/api/v1/venues/{}'.format(venue(i)), None),
+      ('api artists', 'GET', lambda i: '/api/v1/artists', None),
+      ('api artist', 'GET', lambda i: '/api/v1/artists/{}'.format(artist(i)), None),
+      ('api shows', 'GET', lambda i: '/api/v1/shows', None),
+    ]
+
+#----------------------------------------------------------------------------#
+# Measurements
+#----------------------------------------------------------------------------#
+
+def percentile(values, p):
+    # nearest rank
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, math.ceil(p * len(values) / 100.0) - 1))]
+
+def measure(client, route, requests, alloc_requests):
+    from instrumentation import count_queries
+
+    name, method, url, data = route
+    if method == 'GET':
+        # warm up template and statement caches
+        client.get(url(0))
+    timings, queries = [], []
+    for i in range(requests):
+        with count_queries() as statements:
+            started = time.perf_counter()
+            response = client.open(url(i), method=method, data=data and data(i))
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError('{} {} returned {}'.format(method, url(i), response.status_code))
+        queries.append(len(statements))
+
+    # separate pass, tracing allocations slows requests down considerably;
+    # clearing the traces also resets the peak, which is then the most
+    # memory held at once during the request
+    allocations = []
+    tracemalloc.start()
+    for i in range(requests, requests + alloc_requests):
+        tracemalloc.clear_traces()
+        client.open(url(i), method=method, data=data and data(i))
+        allocations.append(tracemalloc.get_traced_memory()[1] / 1024)
+    tracemalloc.stop()
+
+    return {
+      'p50': percentile(timings, 50),
+      'p95': percentile(timings, 95),
+      'p99': percentile(timings, 99),
+      'queries': max(queries),
+      'alloc_kib': max(allocations) if allocations else 0
+    }
+
+def compare(results, baseline, tolerance):
+    # queries must not grow at all, latency and allocations by more than
+    # tolerance (a fraction of the baseline)
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            regressions.append('{}: {} queries, baseline {}'.format(name, result['queries'], base['queries']))
+        for key in ('p95', 'alloc_kib'):
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append('{}: {} {:.1f}, baseline {:.1f}'.format(name, key, result[key], base[key]))
+    return regressions
+
+def report(results, baseline):
+    header = '{:<20} {:>9} {:>9} {:>9} {:>8} {:>11}'.format('route', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'alloc KiB')
+    print(header)
+    print('-' * len(header))
+    for name, r in results.items():
+        line = '{:<20} {:>9.2f} {:>9.2f} {:>9.2f} {:>8} {:>11.1f}'.format(
+          name, r['p50'], r['p95'], r['p99'], r['queries'], r['alloc_kib'])
+        base = baseline.get(name)
+        if base:
+            line += '   (p95 {:+.0%}, queries {:+d})'.format(
+              r['p95'] / base['p95'] - 1 if base['p95'] else 0, r['queries'] - base['queries'])
+        print(line)
+
+#----------------------------------------------------------------------------#
+# Launch.
+#----------------------------------------------------------------------------#
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Fyyur routes against a seeded database.')
+    parser.add_argument('--database', default='sqlite:///' + os.path.abspath('benchmark.db'),
+      help='Throwaway database URI, dropped and reseeded on every run.')
+    parser.add_argument('--venues', type=int, default=500)
+    parser.add_argument('--artists', type=int, default=500)
+    parser.add_argument('--shows', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=50, help='Timed requests per route.')
+    parser.add_argument('--alloc-requests', type=int, default=5, help='Requests per route traced for allocations.')
+    parser.add_argument('--routes', help='Comma separated route names to run, all by default.')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+      help='Allowed p95 latency and allocation growth over the baseline.')
+    args = parser.parse_args(argv)
+
+    if args.database == config.SQLALCHEMY_DATABASE_URI:
+        parser.error('refusing to reseed the configured application database')
+    if args.venues <= args.requests + args.alloc_requests:
+        parser.error('--venues must exceed the requests per route, venues are deleted by the benchmark')
+
+    fyyur = load_app(args.database)
+    seed(fyyur.db, args.venues, args.artists, args.shows)
+    client = fyyur.app.test_client()
+
+    selected = args.routes.split(',') if args.routes else None
+    results = {}
+    for route in routes(args.venues, args.artists, args.requests + args.alloc_requests):
+        if selected is None or route[0] in selected:
+            results[route[0]] = measure(client, route, args.requests, args.alloc_requests)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('Saved baseline to ' + args.baseline)
+        return 0
+
+    if not baseline:
+        print('NO BASELINE at {}, run with --save-baseline first'.format(args.baseline))
+        return 1
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import g, request, session, Response
+from models import app
+
+#----------------------------------------------------------------------------#
+# Cache Backends
+#----------------------------------------------------------------------------#
+
+class LRUCache(object):
+    # in-process cache, evicts the least recently used entry when full
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileSystemCache(object):
+    # one pickle file per entry, shared by all workers using the same
+    # directory; when it holds more than max_entries files the least recently
+    # used ones, by modification time, are removed
+
+    def __init__(self, directory, max_entries=1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires is not None and expires < time.time():
+            self.delete(key)
+            return None
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        # write to a temporary file first so readers never see partial entries
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))
+        self._prune()
+
+    def _prune(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                pass
+        if len(entries) <= self.max_entries:
+            return
+        # an evicted tag starts a new version, which only turns the entries
+        # recorded under it into misses
+        entries.sort()
+        for mtime, path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+#----------------------------------------------------------------------------#
+# Response Cache
+#----------------------------------------------------------------------------#
+
+# Every cached page records the version of each tag it depends on, e.g.
+# 'venues' for anything listing venues or 'venue:3' for anything showing
+# venue 3. Write handlers invalidate tags by giving them a new random
+# version, which turns every entry recorded under an older version into a
+# miss without having to know which keys those entries live under.
+#
+# Invalidations only reach the backend of the process making them, so the
+# flask import and rollover-shows commands cannot reach a web server's
+# 'memory' cache. Entries of views decorated with conditional therefore also
+# record the validator computed from the database and only match requests
+# that compute the same one.
+
+class ResponseCache(object):
+
+    def __init__(self, backend=None, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0}
+
+    def init_app(self, app):
+        kind = app.config.get('CACHE_BACKEND', 'memory')
+        if kind == 'filesystem':
+            self.backend = FileSystemCache(app.config['CACHE_DIR'], app.config.get('CACHE_MAX_ENTRIES', 1024))
+        elif kind == 'memory':
+            self.backend = LRUCache(app.config.get('CACHE_MAX_ENTRIES', 1024))
+        else:
+            self.backend = None
+        self.ttl = app.config.get('CACHE_DEFAULT_TTL', self.ttl)
+
+    def _version(self, tag):
+        version = self.backend.get('tag:' + tag)
+        if version is None:
+            # a tag that was never seen or was evicted starts a new version,
+            # so entries recorded under an earlier one can never match again
+            version = uuid.uuid4().hex
+            self.backend.set('tag:' + tag, version)
+        return version
+
+    def tag(self, *tags):
+        # declare tags the current response depends on beyond the ones the
+        # view was decorated with, e.g. the venues listed on an artist page
+        if 'cache_tags' in g and self.backend is not None:
+            for tag in tags:
+                g.cache_tags.setdefault(tag, self._version(tag))
+
+    def invalidate(self, *tags):
+        if self.backend is None:
+            return
+        for tag in tags:
+            self.backend.set('tag:' + tag, uuid.uuid4().hex)
+            self.stats['invalidations'] += 1
+
+    def invalidate_all(self):
+        # every entry depends on the 'all' tag, for bulk writes that touch
+        # too many venues and artists to invalidate them one by one
+        self.invalidate('all')
+
+    def _fresh(self, entry):
+        if entry.get('validator') != g.get('validator'):
+            return False
+        return all(self._version(tag) == version for tag, version in entry['tags'].items())
+
+    def cached(self, *tags, params=()):
+        # cache successful GET responses by path and the query parameters in
+        # params, the ones the view reads, so other query strings share the
+        # entry instead of adding one each; tags may contain format fields
+        # for view arguments, e.g. 'venue:{venue_id}'
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if self.backend is None or request.method != 'GET' or session.get('_flashes'):
+                    return f(*args, **kwargs)
+
+                key = 'view:' + request.path + '?' + urlencode(
+                  [(param, value) for param in sorted(params) for value in request.args.getlist(param)])
+                # a session pinned to the primary after a write may find an
+                # entry rendered from a lagging replica, render it afresh
+                entry = None if g.get('primary_pinned') else self.backend.get(key)
+                if entry is not None and self._fresh(entry):
+                    self.stats['hits'] += 1
+                    response = Response(entry['data'], entry['status'], entry['headers'])
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+                self.stats['misses'] += 1
+
+                # read tag versions before the view queries the database, so
+                # a write committed while the view runs leaves the entry
+                # recorded under the version that write replaced
+                g.cache_tags = {}
+                self.tag('all', *[t.format(**kwargs) for t in tags])
+                response = app.make_response(f(*args, **kwargs))
+                ttl = self.ttl
+                if g.get('read_replica'):
+                    # the replica may still miss a write that already
+                    # invalidated the tags, keep its pages no longer than the
+                    # writer reads from the primary
+                    sticky = app.config.get('REPLICA_STICKY_SECONDS', 10)
+                    ttl = min(ttl, sticky) if ttl else sticky
+                if response.status_code == 200 and not response.direct_passthrough:
+                    self.backend.set(key, {
+                      'data': response.get_data(),
+                      'status': response.status_code,
+                      'headers': [('Content-Type', response.content_type)],
+                      'tags': g.cache_tags,
+                      'validator': g.get('validator')
+                    }, ttl)
+                    self.stats['stores'] += 1
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache()
+response_cache.init_app(app)
@@ -0,0 +1,103 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import Response, g, request, session
+from sqlalchemy import func
+from werkzeug.http import is_resource_modified
+from models import app, db, Venue, Artist, Show, TableVersion
+
+#----------------------------------------------------------------------------#
+# Conditional Requests
+#----------------------------------------------------------------------------#
+
+# Venue, Artist and Show carry a last_modified timestamp that is set on
+# insert and bumped by every update, including the counter updates, always
+# from the database clock (models.utcnow) so no writer can fall behind the
+# newest stamp, and deletes bump the table's row in TableVersion. A page is
+# described by a single row of index lookups over those, which is far
+# cheaper than the queries rendering it, and the ETag / Last-Modified
+# validators derived from that row let clients revalidate with a 304.
+
+def bump_table_versions(*models):
+    # call in the transaction deleting rows of models
+    db.session.query(TableVersion)\
+      .filter(TableVersion.name.in_([model.__tablename__ for model in models]))\
+      .update({TableVersion.version: TableVersion.version + 1}, synchronize_session=False)
+
+def _table_state(model):
+    # newest change, answered by the last_modified index, and the version
+    # catching deleted rows
+    return (
+      db.session.query(func.max(model.last_modified)).scalar_subquery(),
+      db.session.query(TableVersion.version)
+        .filter(TableVersion.name == model.__tablename__).scalar_subquery()
+    )
+
+def listing_state(*models):
+    columns = [c for model in models for c in _table_state(model)]
+    return db.session.query(*columns).one()
+
+def _owner_state(model, fk, other, other_fk, owner_id):
+    # the owner, its shows and the other side of each show, plus the start
+    # time of the latest show that has already started, so the page changes
+    # when a show moves from upcoming to past
+    now = datetime.now()
+    return db.session.query(
+        model.last_modified,
+        func.max(Show.last_modified),
+        func.max(other.last_modified),
+        func.max(Show.start_time).filter(Show.start_time <= now).label('last_started'),
+        func.count(Show.id)
+      )\
+      .outerjoin(Show, fk == model.id)\
+      .outerjoin(other, other.id == other_fk)\
+      .filter(model.id == owner_id)\
+      .group_by(model.id, model.last_modified)\
+      .first()
+
+def venue_state(venue_id):
+    return _owner_state(Venue, Show.venue_id, Artist, Show.artist_id, venue_id)
+
+def artist_state(artist_id):
+    return _owner_state(Artist, Show.artist_id, Venue, Show.venue_id, artist_id)
+
+def _validators(state):
+    etag = hashlib.sha1(repr(tuple(state)).encode()).hexdigest()
+    # last_modified stamps are naive UTC from the database clock (utcnow),
+    # show start times naive local times; HTTP dates are UTC
+    started = state._mapping.get('last_started')
+    times = [v for v in state if isinstance(v, datetime) and v is not started]
+    if started is not None:
+        times.append(started.astimezone(timezone.utc).replace(tzinfo=None))
+    last_modified = max(times) if times else None
+    return etag, last_modified
+
+def conditional(state):
+    # answer If-None-Match / If-Modified-Since from state(**view_args)
+    # before the view runs; pages with pending flash messages are always
+    # rendered, and a view whose state is None (e.g. a missing venue) runs
+    # normally so it can return its own 404
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or session.get('_flashes'):
+                return f(*args, **kwargs)
+            row = state(**kwargs)
+            if row is None:
+                return f(*args, **kwargs)
+
+            etag, last_modified = _validators(row)
+            # the response cache only serves entries rendered under this
+            # validator, so writes it never heard of (e.g. from the flask
+            # import or rollover-shows commands) still turn them into misses
+            g.validator = etag
+            if is_resource_modified(request.environ, etag, last_modified=last_modified):
+                response = app.make_response(f(*args, **kwargs))
+            else:
+                response = Response(status=304)
+            if response.status_code in (200, 304):
+                response.set_etag(etag, weak=True)
+                response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
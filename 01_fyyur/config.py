@@ -1,5 +1,9 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Signs the session cookie, which also keeps a browser on the primary after
+# it writes (see REPLICA_STICKY_SECONDS), so every worker must use the same
+# key: set SECRET_KEY in the environment. The random fallback only works
+# with a single process.
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -8,3 +12,62 @@ DEBUG = True
 
 # Connect to the database
 SQLALCHEMY_DATABASE_URI = 'postgresql:///fyyurapp'
+
+# Default and maximum number of rows per page on paginated listings
+PAGE_SIZE = 30
+MAX_PAGE_SIZE = 200
+
+# Warn before the first request when a hot query plans a sequential scan of
+# a table with at least QUERY_PLAN_MIN_ROWS rows (Postgres only). The same
+# check runs on demand with 'flask check-plans'.
+CHECK_QUERY_PLANS = True
+QUERY_PLAN_MIN_ROWS = 10000
+
+# Response cache: 'memory' (per process LRU), 'filesystem' (shared by all
+# workers through CACHE_DIR) or 'null' to disable it; either backend keeps
+# at most CACHE_MAX_ENTRIES entries
+CACHE_BACKEND = 'memory'
+CACHE_DIR = os.path.join(basedir, '.cache')
+CACHE_MAX_ENTRIES = 1024
+CACHE_DEFAULT_TTL = 300
+
+# Per request query instrumentation: adds a Server-Timing header and logs
+# requests above any of the thresholds with their slowest statements
+INSTRUMENT_QUERIES = True
+SLOW_REQUEST_MS = 500
+SLOW_REQUEST_DB_MS = 200
+SLOW_REQUEST_QUERIES = 20
+SLOW_QUERY_LOG_COUNT = 5
+
+# Connection pool. Connections beyond DB_POOL_SIZE are opened up to
+# DB_MAX_OVERFLOW during bursts, after that requests wait up to
+# DB_POOL_TIMEOUT seconds for one. Connections older than DB_POOL_RECYCLE
+# seconds are replaced and DB_POOL_PRE_PING tests each one on checkout.
+# With DB_PGBOUNCER the app keeps no pool of its own and leaves pooling to
+# PgBouncer (transaction pooling, no prepared statements).
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 10
+DB_POOL_TIMEOUT = 10
+DB_POOL_RECYCLE = 1800
+DB_POOL_PRE_PING = True
+DB_PGBOUNCER = False
+
+# Read replicas for the read-only views, e.g.
+# ['postgresql://replica1/fyyurapp', 'postgresql://replica2/fyyurapp'].
+# After a write the same browser session reads from the primary for
+# REPLICA_STICKY_SECONDS so it sees its own changes.
+SQLALCHEMY_REPLICA_URIS = []
+REPLICA_STICKY_SECONDS = 10
+
+# Roll show counters over from a background thread instead of running
+# 'flask rollover-shows' from cron. The thread wakes up when the next show
+# starts or every SHOW_ROLLOVER_INTERVAL seconds, and on startup catches up
+# on shows that started in the last SHOW_ROLLOVER_LOOKBACK_MINUTES.
+SHOW_ROLLOVER_THREAD = True
+SHOW_ROLLOVER_INTERVAL = 60
+SHOW_ROLLOVER_LOOKBACK_MINUTES = 60
+
+# Loader of relationships a view did not declare with load_profile: 'select'
+# lazy loads them, 'raise' fails the request instead. Left unset it is
+# 'raise' when TESTING and 'select' otherwise.
+LAZY_LOADING = None
@@ -0,0 +1,102 @@
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool, NullPool
+
+#----------------------------------------------------------------------------#
+# Connection Pool
+#----------------------------------------------------------------------------#
+
+# Builds SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* settings in config.py
+# and times every checkout, so pool saturation shows up in /pool/stats long
+# before requests start failing with QueuePool timeouts.
+
+
+class PoolMetrics(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.saturation_max = 0.0
+
+    def record(self, wait, saturation, timed_out=False):
+        with self._lock:
+            self.checkouts += not timed_out
+            self.timeouts += timed_out
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.saturation_max = max(self.saturation_max, saturation)
+
+
+metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool recording how long each checkout waited for a connection
+
+    def saturation(self):
+        # share of the pool, including overflow, that is checked out
+        capacity = self.size() + max(self._max_overflow, 0)
+        return self.checkedout() / capacity if capacity else 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super(TimedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            metrics.record(time.perf_counter() - started, self.saturation(), timed_out=True)
+            raise
+        metrics.record(time.perf_counter() - started, self.saturation())
+        return connection
+
+
+def engine_options(config):
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        # no server connections to pool
+        return {}
+    if config.get('DB_PGBOUNCER'):
+        # PgBouncer owns the pool: hold no idle connections of our own and
+        # rely on psycopg2 sending plain (unprepared) statements, which works
+        # with transaction pooling
+        return {'poolclass': NullPool}
+    return {
+      'poolclass': TimedQueuePool,
+      'pool_size': config.get('DB_POOL_SIZE', 5),
+      'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+      'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+      'pool_recycle': config.get('DB_POOL_RECYCLE', -1),
+      'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+      # reuse the most recently returned connections so the ones opened
+      # during a burst go idle and get recycled instead of kept warm
+      'pool_use_lifo': True,
+    }
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {
+      'class': type(pool).__name__,
+      'checkouts': metrics.checkouts,
+      'timeouts': metrics.timeouts,
+      'wait_avg_ms': metrics.wait_total / metrics.checkouts * 1000 if metrics.checkouts else 0.0,
+      'wait_max_ms': metrics.wait_max * 1000,
+      'saturation_max': metrics.saturation_max,
+    }
+    if isinstance(pool, TimedQueuePool):
+        stats.update({
+          'size': pool.size(),
+          'checked_out': pool.checkedout(),
+          'checked_in': pool.checkedin(),
+          'overflow': pool.overflow(),
+          'saturation': pool.saturation(),
+        })
+    return stats
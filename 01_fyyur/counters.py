@@ -0,0 +1,186 @@
+import threading
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import func, select
+from models import app, db, Venue, Artist, Show
+from cache import response_cache
+from conditional import bump_table_versions
+
+#----------------------------------------------------------------------------#
+# Show Counters
+#----------------------------------------------------------------------------#
+
+# Venue.upcoming_show_count / past_show_count and the Artist equivalents are
+# denormalized copies of what the Show table says at a given moment. They are
+# adjusted in the same transaction as every show write and recomputed by the
+# rollover job for owners whose shows have moved from upcoming to past.
+
+def _count_shows(model, fk, upcoming, now):
+    window = Show.start_time > now if upcoming else Show.start_time <= now
+    return select([func.count(Show.id)])\
+      .where(fk == model.id)\
+      .where(window)\
+      .scalar_subquery()
+
+def _recompute(model, fk, now, ids=None):
+    query = db.session.query(model)
+    if ids is not None:
+        query = query.filter(model.id.in_(ids))
+    return query.update({
+      model.upcoming_show_count: _count_shows(model, fk, True, now),
+      model.past_show_count: _count_shows(model, fk, False, now)
+    }, synchronize_session=False)
+
+def record_show(show, now=None):
+    # bump the counters of the venue and artist a new show belongs to
+    now = now or datetime.now()
+    column = 'upcoming_show_count' if show.start_time > now else 'past_show_count'
+    for model, owner_id in ((Venue, show.venue_id), (Artist, show.artist_id)):
+        counter = getattr(model, column)
+        db.session.query(model).filter(model.id == owner_id)\
+          .update({counter: counter + 1}, synchronize_session=False)
+
+def delete_shows(venue_id=None, artist_id=None, now=None):
+    # delete the shows of a venue or artist that is about to be removed and
+    # take them off the counters of the other side of each show
+    now = now or datetime.now()
+    if venue_id is not None:
+        owner_fk, other_model, other_fk = Show.venue_id == venue_id, Artist, Show.artist_id
+    else:
+        owner_fk, other_model, other_fk = Show.artist_id == artist_id, Venue, Show.venue_id
+
+    affected = db.session.query(
+        other_fk.label('id'),
+        func.count(Show.id).filter(Show.start_time > now).label('upcoming'),
+        func.count(Show.id).filter(Show.start_time <= now).label('past')
+      )\
+      .filter(owner_fk)\
+      .group_by(other_fk).all()
+
+    for row in affected:
+        db.session.query(other_model).filter(other_model.id == row.id).update({
+          other_model.upcoming_show_count: other_model.upcoming_show_count - row.upcoming,
+          other_model.past_show_count: other_model.past_show_count - row.past
+        }, synchronize_session=False)
+
+    bump_table_versions(Show)
+    return db.session.query(Show).filter(owner_fk).delete(synchronize_session=False)
+
+def rollover_show_counters(since=None, now=None):
+    # recompute the counters of every venue and artist with a show that
+    # started in (since, now]; without since all counters are rebuilt
+    now = now or datetime.now()
+    if since is None:
+        return _recompute(Venue, Show.venue_id, now), _recompute(Artist, Show.artist_id, now)
+
+    started = (Show.start_time > since, Show.start_time <= now)
+    venue_ids = select([Show.venue_id]).where(*started).distinct()
+    artist_ids = select([Show.artist_id]).where(*started).distinct()
+    return (
+      _recompute(Venue, Show.venue_id, now, venue_ids),
+      _recompute(Artist, Show.artist_id, now, artist_ids)
+    )
+
+def started_owners(since, now):
+    # ids of the venues and artists with a show that started in (since, now]
+    started = (Show.start_time > since, Show.start_time <= now)
+    return (
+      [id for id, in db.session.query(Show.venue_id).filter(*started).distinct()],
+      [id for id, in db.session.query(Show.artist_id).filter(*started).distinct()]
+    )
+
+#----------------------------------------------------------------------------#
+# Rollover Scheduler
+#----------------------------------------------------------------------------#
+
+class RolloverScheduler(object):
+    # in-process alternative to running 'flask rollover-shows' from cron: a
+    # daemon thread that sleeps until the next show starts, or at most
+    # interval seconds, then rolls over the shows that started since its
+    # last run and invalidates the cached pages showing their counts.
+    # wake() makes it look for the next start time again, e.g. after a show
+    # was added that starts before the one it is waiting for.
+
+    def __init__(self, app, interval=60, lookback=timedelta(hours=1)):
+        self.app = app
+        self.interval = interval
+        self.lookback = lookback
+        self.last_run = None
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # catch up on shows that started while no scheduler was running
+        self.last_run = datetime.now() - self.lookback
+        self._thread = threading.Thread(target=self._run, name='show-rollover', daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def run_once(self, now=None):
+        # returns the start time of the next upcoming show, if any
+        now = now or datetime.now()
+        with self.app.app_context():
+            try:
+                venue_ids, artist_ids = started_owners(self.last_run, now)
+                if venue_ids:
+                    _recompute(Venue, Show.venue_id, now, venue_ids)
+                if artist_ids:
+                    _recompute(Artist, Show.artist_id, now, artist_ids)
+                db.session.commit()
+                if venue_ids or artist_ids:
+                    response_cache.invalidate('venues', 'artists',
+                      *['venue:{}'.format(id) for id in venue_ids] + ['artist:{}'.format(id) for id in artist_ids])
+                self.last_run = now
+                return db.session.query(func.min(Show.start_time)).filter(Show.start_time > now).scalar()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Show rollover failed')
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while True:
+            next_start = self.run_once()
+            timeout = self.interval
+            if next_start is not None:
+                timeout = min(timeout, max((next_start - datetime.now()).total_seconds(), 0) + 0.1)
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+
+rollover_scheduler = RolloverScheduler(
+  app,
+  interval=app.config.get('SHOW_ROLLOVER_INTERVAL', 60),
+  lookback=timedelta(minutes=app.config.get('SHOW_ROLLOVER_LOOKBACK_MINUTES', 60))
+)
+
+@app.before_first_request
+def start_rollover_scheduler():
+    if app.config.get('SHOW_ROLLOVER_THREAD'):
+        rollover_scheduler.start()
+
+@app.cli.command('rollover-shows')
+@click.option('--minutes', default=60, show_default=True,
+  help='Look-back window for shows that started since the last run.')
+@click.option('--full', is_flag=True, help='Recompute the counters of all venues and artists.')
+def rollover_shows_command(minutes, full):
+    # meant to run from cron more often than --minutes, overlapping windows
+    # are harmless because counters are recomputed rather than adjusted
+    now = datetime.now()
+    since = None if full else now - timedelta(minutes=minutes)
+    try:
+        venues, artists = rollover_show_counters(since, now)
+        db.session.commit()
+        # reaches a shared 'filesystem' cache; 'memory' caches of running
+        # servers notice the new last_modified through their validators
+        response_cache.invalidate_all()
+        click.echo('Updated show counters of {} venues and {} artists.'.format(venues, artists))
+    except:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
@@ -0,0 +1,165 @@
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from itertools import groupby, islice
+import click
+from flask import Response, abort, stream_with_context
+from models import app, db, Area, Venue, Artist, Show, Genre, venue_genre, artist_genre
+
+#----------------------------------------------------------------------------#
+# Bulk Export
+#----------------------------------------------------------------------------#
+
+# Exports are streamed from a server-side cursor (yield_per turns on
+# stream_results), so memory use is bounded by the chunk size whatever the
+# table size. Column names match what 'flask import' reads back.
+
+CHUNK_SIZE = 1000
+
+VENUE_COLUMNS = ['id', 'name', 'city', 'state', 'address', 'phone', 'genres', 'image_link',
+  'facebook_link', 'website_link', 'seeking_talent', 'seeking_description']
+ARTIST_COLUMNS = ['id', 'name', 'city', 'state', 'phone', 'genres', 'image_link',
+  'facebook_link', 'website_link', 'seeking_venue', 'seeking_description']
+SHOW_COLUMNS = ['id', 'start_time', 'artist_id', 'artist_name', 'venue_id', 'venue_name']
+
+
+def _owner_rows(model, association, columns, seeking):
+    # one row per owner and genre, ordered by owner so the genres of an
+    # owner can be folded into a list while streaming
+    seeking_name, seeking_column = seeking
+    owner_id = association.c[model.__tablename__.lower() + '_id']
+    fields = [getattr(model, c) for c in columns if c not in ('genres', 'city', 'state', seeking_name)]
+    query = db.session.query(*fields, Area.city, Area.state, seeking_column.label(seeking_name),
+        Genre.name.label('genre'))\
+      .join(Area, Area.id == model.area_id)\
+      .outerjoin(association, owner_id == model.id)\
+      .outerjoin(Genre, Genre.id == association.c.genre_id)\
+      .order_by(model.id, Genre.name)\
+      .yield_per(CHUNK_SIZE)
+
+    for _, rows in groupby(query, key=lambda r: r.id):
+        rows = list(rows)
+        row = dict(rows[0]._mapping)
+        row['genres'] = [r.genre for r in rows if r.genre is not None]
+        del row['genre']
+        yield row
+
+def venue_rows():
+    return _owner_rows(Venue, venue_genre, VENUE_COLUMNS, ('seeking_talent', Venue.looking_for_talent))
+
+def artist_rows():
+    return _owner_rows(Artist, artist_genre, ARTIST_COLUMNS, ('seeking_venue', Artist.looking_for_venues))
+
+def show_rows():
+    query = db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Show.venue_id,
+        Venue.name.label('venue_name')
+      )\
+      .join(Artist, Artist.id == Show.artist_id)\
+      .join(Venue, Venue.id == Show.venue_id)\
+      .order_by(Show.id)\
+      .yield_per(CHUNK_SIZE)
+    for row in query:
+        yield dict(row._mapping)
+
+EXPORTS = {
+  'venues': (venue_rows, VENUE_COLUMNS),
+  'artists': (artist_rows, ARTIST_COLUMNS),
+  'shows': (show_rows, SHOW_COLUMNS),
+}
+
+#----------------------------------------------------------------------------#
+# Formats
+#----------------------------------------------------------------------------#
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _csv_value(value):
+    # lowercase booleans and comma separated genres read back by the forms
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, list):
+        return ', '.join(value)
+    return _value(value)
+
+def _chunks(rows, size=CHUNK_SIZE):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def to_csv(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in _chunks(rows):
+        for row in chunk:
+            writer.writerow([_csv_value(row[c]) for c in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def to_jsonl(rows, columns):
+    for chunk in _chunks(rows):
+        yield ''.join(json.dumps({c: _value(row[c]) for c in columns}, separators=(',', ':')) + '\n'
+          for row in chunk)
+
+def to_columnar(rows, columns):
+    # one JSON object of equally long column arrays per line, each line maps
+    # to a Parquet row group, e.g. via pyarrow.Table.from_pydict
+    for chunk in _chunks(rows):
+        yield json.dumps({c: [_value(row[c]) for row in chunk] for c in columns},
+          separators=(',', ':')) + '\n'
+
+FORMATS = {
+  'csv': (to_csv, 'text/csv'),
+  'jsonl': (to_jsonl, 'application/x-ndjson'),
+  'columnar': (to_columnar, 'application/x-ndjson'),
+}
+
+def export(kind, format):
+    rows, columns = EXPORTS[kind]
+    writer, _ = FORMATS[format]
+    return writer(rows(), columns)
+
+#----------------------------------------------------------------------------#
+# Endpoint and Command
+#----------------------------------------------------------------------------#
+
+@app.route('/export/<kind>.<format>')
+@db.read_only
+def export_catalog(kind, format):
+    if kind not in EXPORTS or format not in FORMATS:
+        abort(404)
+    return Response(
+      stream_with_context(export(kind, format)),
+      mimetype=FORMATS[format][1],
+      headers={'Content-Disposition': 'attachment; filename={}.{}'.format(kind, format)}
+    )
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(list(EXPORTS)))
+@click.option('--format', 'format', type=click.Choice(list(FORMATS)), default='csv', show_default=True)
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Defaults to stdout.')
+def export_command(kind, format, output):
+    """Stream venues, artists or shows as CSV, JSON lines or columnar chunks."""
+    f = open(output, 'w', newline='') if output else sys.stdout
+    try:
+        for data in export(kind, format):
+            f.write(data)
+    finally:
+        if output:
+            f.close()
+        db.session.close()
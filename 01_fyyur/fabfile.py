@@ -6,9 +6,9 @@ from fabric.contrib.console import confirm
 
 def test():
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
+        # fails on query count, latency or allocation regressions against
+        # the pinned counts and the stored benchmark baseline
+        result = local("python -m pytest -q && python benchmark.py", capture=True)
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
@@ -0,0 +1,240 @@
+import csv
+import json
+import os
+from datetime import datetime
+from itertools import islice
+import click
+from werkzeug.datastructures import MultiDict
+from forms import VenueForm, ArtistForm, ShowForm
+from models import app, db, Venue, Artist, Show, Genre, venue_genre, artist_genre
+from queries import area_by_name
+from counters import rollover_show_counters
+from cache import response_cache
+
+#----------------------------------------------------------------------------#
+# Bulk Import
+#----------------------------------------------------------------------------#
+
+# Rows are streamed from CSV or JSON lines files, validated with the same
+# forms as the web handlers and inserted one executemany statement per batch
+# and table. Invalid rows are reported with their line number and skipped.
+
+def read_rows(f, format, error):
+    # yields (line number, row dict) pairs, lines that are not a JSON object
+    # are passed to error(line number, message) and skipped
+    if format == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                error(line_num, 'invalid JSON: {}'.format(e))
+                continue
+            if not isinstance(row, dict):
+                error(line_num, 'expected a JSON object')
+                continue
+            yield line_num, row
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def _form_data(row):
+    data = MultiDict()
+    for key, value in row.items():
+        if key == 'genres':
+            if isinstance(value, str):
+                value = [g.strip() for g in value.split(',')]
+            data.setlist(key, [g for g in value if g])
+        elif isinstance(value, bool):
+            data[key] = 'y' if value else ''
+        elif key == 'start_time' and value:
+            # accept ISO 8601 as well as the form's own format
+            try:
+                value = datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                pass
+            data[key] = value
+        elif value is not None:
+            data[key] = str(value)
+    return data
+
+
+class Importer(object):
+
+    def __init__(self, kind, batch_size=1000):
+        self.kind = kind
+        self.batch_size = batch_size
+        self.inserted = 0
+        self.errors = []
+        self._genre_ids = {}
+        self._area_ids = {}
+        self._ids = {'artist': {}, 'venue': {}}
+
+    def error(self, line_num, message):
+        self.errors.append((line_num, message))
+        click.echo('line {}: {}'.format(line_num, message), err=True)
+
+    def run(self, rows):
+        for batch in _batches(rows, self.batch_size):
+            try:
+                getattr(self, 'load_' + self.kind)(batch)
+                db.session.commit()
+            except:
+                db.session.rollback()
+                raise
+        db.session.close()
+
+    def _validate(self, form_class, batch):
+        valid = []
+        for line_num, row in batch:
+            form = form_class(_form_data(row), meta={'csrf': False})
+            if form.validate():
+                valid.append((line_num, form))
+            else:
+                self.error(line_num, form.errors)
+        return valid
+
+    def _genre_id(self, name):
+        if name not in self._genre_ids:
+            genre = Genre.query.filter_by(name=name).first()
+            if genre is None:
+                genre = Genre(name=name)
+                db.session.add(genre)
+                db.session.flush()
+            self._genre_ids[name] = genre.id
+        return self._genre_ids[name]
+
+    def _area_id(self, city, state):
+        key = (' '.join(city.split()).lower(), state)
+        if key not in self._area_ids:
+            area = area_by_name(city, state)
+            db.session.flush()
+            self._area_ids[key] = area.id
+        return self._area_ids[key]
+
+    def _load_owners(self, model, association, batch, values):
+        # insert venues or artists, skipping names that already exist in the
+        # database or earlier in the batch, then link them to their genres
+        forms = self._validate(VenueForm if model is Venue else ArtistForm, batch)
+        names = [form.name.data for _, form in forms]
+        taken = {name for name, in db.session.query(model.name).filter(model.name.in_(names))}
+
+        rows, genres = [], {}
+        for line_num, form in forms:
+            if form.name.data in taken:
+                self.error(line_num, '{} {} already exists'.format(model.__name__, form.name.data))
+                continue
+            taken.add(form.name.data)
+            rows.append(values(form))
+            genres[form.name.data] = form.genres.data
+        if not rows:
+            return
+
+        db.session.execute(model.__table__.insert(), rows)
+        owner = model.__tablename__.lower() + '_id'
+        links = []
+        for id, name in db.session.query(model.id, model.name).filter(model.name.in_(list(genres))):
+            links.extend({owner: id, 'genre_id': self._genre_id(g)} for g in dict.fromkeys(genres[name]))
+        if links:
+            db.session.execute(association.insert(), links)
+        self.inserted += len(rows)
+
+    def load_venues(self, batch):
+        self._load_owners(Venue, venue_genre, batch, lambda form: {
+          'name': form.name.data,
+          'area_id': self._area_id(form.city.data, form.state.data),
+          'address': form.address.data,
+          'phone': form.phone.data,
+          'image_link': form.image_link.data,
+          'facebook_link': form.facebook_link.data,
+          'website_link': form.website_link.data,
+          'looking_for_talent': form.seeking_talent.data,
+          'seeking_description': form.seeking_description.data
+        })
+
+    def load_artists(self, batch):
+        self._load_owners(Artist, artist_genre, batch, lambda form: {
+          'name': form.name.data,
+          'area_id': self._area_id(form.city.data, form.state.data),
+          'phone': form.phone.data,
+          'image_link': form.image_link.data,
+          'facebook_link': form.facebook_link.data,
+          'website_link': form.website_link.data,
+          'looking_for_venues': form.seeking_venue.data,
+          'seeking_description': form.seeking_description.data
+        })
+
+    def _resolve(self, model, kind, batch):
+        # map the artist_name / venue_name references of a batch to ids and
+        # check the ids referenced directly, one query per batch and kind
+        ids = self._ids[kind]
+        names = {row[kind + '_name'] for _, row in batch if row.get(kind + '_name')} - set(ids)
+        if names:
+            ids.update((name, str(id)) for id, name in
+              db.session.query(model.id, model.name).filter(model.name.in_(names)))
+        refs = {str(row[kind + '_id']) for _, row in batch if row.get(kind + '_id')}
+        refs = [int(r) for r in refs if r.isdigit()]
+        return {str(id) for id, in db.session.query(model.id).filter(model.id.in_(refs))}
+
+    def load_shows(self, batch):
+        known = {
+          'artist': self._resolve(Artist, 'artist', batch),
+          'venue': self._resolve(Venue, 'venue', batch)
+        }
+
+        resolved = []
+        for line_num, row in batch:
+            row, errors = dict(row), []
+            for kind in ('artist', 'venue'):
+                name = row.pop(kind + '_name', None)
+                if not row.get(kind + '_id') and name:
+                    if name in self._ids[kind]:
+                        row[kind + '_id'] = self._ids[kind][name]
+                    else:
+                        errors.append('unknown {} {}'.format(kind, name))
+                elif row.get(kind + '_id') and str(row[kind + '_id']) not in known[kind]:
+                    errors.append('unknown {} id {}'.format(kind, row[kind + '_id']))
+            if errors:
+                self.error(line_num, ', '.join(errors))
+            else:
+                resolved.append((line_num, row))
+
+        rows = [{
+          'start_time': form.start_time.data,
+          'artist_id': int(form.artist_id.data),
+          'venue_id': int(form.venue_id.data)
+        } for _, form in self._validate(ShowForm, resolved)]
+        if rows:
+            db.session.execute(Show.__table__.insert(), rows)
+            self.inserted += len(rows)
+
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']),
+  help='Input format, guessed from the file extension by default.')
+@click.option('--batch-size', default=1000, show_default=True)
+def import_command(kind, path, format, batch_size):
+    """Bulk load venues, artists or shows from a CSV or JSON lines file."""
+    format = format or ('csv' if os.path.splitext(path)[1].lower() == '.csv' else 'jsonl')
+    importer = Importer(kind, batch_size)
+    with open(path, newline='') as f:
+        importer.run(read_rows(f, format, importer.error))
+
+    if kind == 'shows':
+        rollover_show_counters()
+        db.session.commit()
+        db.session.close()
+    response_cache.invalidate_all()
+    click.echo('Imported {} {}, {} rows rejected.'.format(importer.inserted, kind, len(importer.errors)))
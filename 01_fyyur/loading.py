@@ -0,0 +1,68 @@
+from functools import wraps
+from flask import g, has_request_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import joinedload, raiseload, selectinload
+
+#----------------------------------------------------------------------------#
+# Loader Profiles
+#----------------------------------------------------------------------------#
+
+# Relationships of the models are not loaded unless a view asks for them:
+# each view declares the relationships it reads with load_profile, and those
+# loader options are added to the view's top-level ORM queries of the owning
+# model. Any other relationship access falls back to the model default,
+# LAZY_LOADING, which is 'raise' under TESTING so an accidental lazy load
+# fails the request instead of quietly adding a query per row.
+
+STRATEGIES = {
+  'selectin': selectinload,
+  'joined': joinedload,
+  'raiseload': raiseload,
+}
+
+
+def lazy_strategy(config):
+    return config.get('LAZY_LOADING') or ('raise' if config.get('TESTING') else 'select')
+
+
+def load_profile(**relationships):
+    # e.g. @load_profile(selectin=[Venue.genres], raiseload=[Venue.shows])
+    options = []
+    for strategy, attributes in relationships.items():
+        if strategy not in STRATEGIES:
+            raise ValueError('unknown loader strategy {!r}'.format(strategy))
+        options.extend((attribute, STRATEGIES[strategy]) for attribute in attributes)
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            g.load_options = options
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _entity_mappers(statement):
+    # mappers of the full entities a select returns, not those of single
+    # columns such as Venue.id
+    mappers = set()
+    for column in statement.column_descriptions:
+        if column['expr'] is not None and column['expr'] is column['entity']:
+            mappers.add(inspect(column['entity']).mapper)
+    return mappers
+
+
+def apply_load_profiles(session):
+    # session is the scoped session of the app, i.e. db.session
+
+    @event.listens_for(session, 'do_orm_execute')
+    def add_load_options(state):
+        if not (has_request_context() and g.get('load_options')):
+            return
+        if not state.is_select or state.is_column_load or state.is_relationship_load:
+            return
+        mappers = _entity_mappers(state.statement)
+        options = [loader(attribute) for attribute, loader in g.load_options
+                   if attribute.parent.mapper in mappers]
+        if options:
+            state.statement = state.statement.options(*options)
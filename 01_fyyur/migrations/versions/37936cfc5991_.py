@@ -0,0 +1,39 @@
+"""add show counters to venues and artists
+
+Revision ID: 37936cfc5991
+Revises: 19057cd1d6b6
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '37936cfc5991'
+down_revision = '19057cd1d6b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('upcoming_show_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_show_count', sa.Integer(), server_default='0', nullable=False))
+
+    # backfill the counters from the existing shows
+    for table, fk in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute(
+            'UPDATE "{table}" SET '
+            'upcoming_show_count = (SELECT count(*) FROM "Show" '
+            'WHERE "Show".{fk} = "{table}".id AND "Show".start_time > LOCALTIMESTAMP), '
+            'past_show_count = (SELECT count(*) FROM "Show" '
+            'WHERE "Show".{fk} = "{table}".id AND "Show".start_time <= LOCALTIMESTAMP)'
+            .format(table=table, fk=fk)
+        )
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_show_count')
+        op.drop_column(table, 'upcoming_show_count')
@@ -0,0 +1,29 @@
+"""add TableVersion, bumped by deletes, for the listing validators
+
+Revision ID: 3c8f1a7d5e92
+Revises: f2b9d4e6a815
+Create Date: 2026-10-18 20:41:09.664283
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8f1a7d5e92'
+down_revision = 'f2b9d4e6a815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_version = op.create_table('TableVersion',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('version', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(table_version, [{'name': name, 'version': 0} for name in ('Venue', 'Artist', 'Show')])
+
+
+def downgrade():
+    op.drop_table('TableVersion')
@@ -0,0 +1,34 @@
+"""add trigram search indexes to venues and artists
+
+Revision ID: 5c0e8a2f71d4
+Revises: 37936cfc5991
+Create Date: 2026-10-18 10:02:17.904113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c0e8a2f71d4'
+down_revision = '37936cfc5991'
+branch_labels = None
+depends_on = None
+
+
+# must match Search.document in search.py for the planner to use the index
+SEARCH_DOCUMENT = "lower(name || ' ' || city || ' ' || state || ' ' || genres)"
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artist'):
+        op.execute(
+            'CREATE INDEX ix_{lower}_search_trgm ON "{table}" USING gin (({document}) gin_trgm_ops)'
+            .format(lower=table.lower(), table=table, document=SEARCH_DOCUMENT)
+        )
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.execute('DROP INDEX ix_{}_search_trgm'.format(table.lower()))
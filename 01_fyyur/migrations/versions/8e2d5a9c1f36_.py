@@ -0,0 +1,29 @@
+"""stamp last_modified from the database clock in UTC
+
+Revision ID: 8e2d5a9c1f36
+Revises: 3c8f1a7d5e92
+Create Date: 2026-10-18 22:17:45.381902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2d5a9c1f36'
+down_revision = '3c8f1a7d5e92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing stamps mix the app hosts' clocks with the database's now() in
+    # its session timezone; restart them all from the one clock
+    for table in ('Venue', 'Artist', 'Show'):
+        op.alter_column(table, 'last_modified', server_default=sa.text("TIMEZONE('utc', CURRENT_TIMESTAMP)"))
+        op.execute('UPDATE "{}" SET last_modified = TIMEZONE(\'utc\', CURRENT_TIMESTAMP)'.format(table))
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        op.alter_column(table, 'last_modified', server_default=sa.text('now()'))
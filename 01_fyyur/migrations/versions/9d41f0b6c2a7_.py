@@ -0,0 +1,91 @@
+"""normalize venue and artist genres into a Genre table
+
+Revision ID: 9d41f0b6c2a7
+Revises: 5c0e8a2f71d4
+Create Date: 2026-10-18 11:26:53.017342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d41f0b6c2a7'
+down_revision = '5c0e8a2f71d4'
+branch_labels = None
+depends_on = None
+
+
+# must match Search.document in search.py for the planner to use the index
+SEARCH_DOCUMENT = "lower(name || ' ' || city || ' ' || state)"
+OLD_SEARCH_DOCUMENT = "lower(name || ' ' || city || ' ' || state || ' ' || genres)"
+
+OWNERS = (('Venue', 'venue'), ('Artist', 'artist'))
+
+
+def _create_search_index(table, document):
+    op.execute(
+        'CREATE INDEX ix_{lower}_search_trgm ON "{table}" USING gin (({document}) gin_trgm_ops)'
+        .format(lower=table.lower(), table=table, document=document)
+    )
+
+
+def upgrade():
+    op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for table, owner in OWNERS:
+        op.create_table('{}_genre'.format(owner),
+        sa.Column('{}_id'.format(owner), sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['{}_id'.format(owner)], ['{}.id'.format(table)], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+        sa.PrimaryKeyConstraint('{}_id'.format(owner), 'genre_id')
+        )
+        op.create_index('ix_{0}_genre_genre_id_{0}_id'.format(owner), '{}_genre'.format(owner),
+                        ['genre_id', '{}_id'.format(owner)], unique=False)
+
+    # move the comma separated genre strings into the new tables
+    op.execute(
+        'INSERT INTO "Genre" (name) '
+        'SELECT DISTINCT trim(g.name) FROM ('
+        'SELECT unnest(string_to_array(genres, \',\')) AS name FROM "Venue" UNION '
+        'SELECT unnest(string_to_array(genres, \',\')) AS name FROM "Artist"'
+        ') AS g WHERE trim(g.name) <> \'\''
+    )
+    for table, owner in OWNERS:
+        op.execute(
+            'INSERT INTO {owner}_genre ({owner}_id, genre_id) '
+            'SELECT DISTINCT t.id, g.id FROM "{table}" AS t '
+            'CROSS JOIN LATERAL unnest(string_to_array(t.genres, \',\')) AS s(name) '
+            'JOIN "Genre" AS g ON g.name = trim(s.name)'
+            .format(table=table, owner=owner)
+        )
+
+    for table, owner in OWNERS:
+        op.execute('DROP INDEX ix_{}_search_trgm'.format(table.lower()))
+        op.drop_column(table, 'genres')
+        _create_search_index(table, SEARCH_DOCUMENT)
+
+
+def downgrade():
+    for table, owner in OWNERS:
+        op.execute('DROP INDEX ix_{}_search_trgm'.format(table.lower()))
+        op.add_column(table, sa.Column('genres', sa.String(), nullable=True))
+        op.execute(
+            'UPDATE "{table}" AS t SET genres = ('
+            'SELECT string_agg(g.name, \', \' ORDER BY g.name) FROM {owner}_genre AS tg '
+            'JOIN "Genre" AS g ON g.id = tg.genre_id WHERE tg.{owner}_id = t.id)'
+            .format(table=table, owner=owner)
+        )
+        op.execute('UPDATE "{}" SET genres = \'\' WHERE genres IS NULL'.format(table))
+        op.alter_column(table, 'genres', existing_type=sa.String(), nullable=False)
+        _create_search_index(table, OLD_SEARCH_DOCUMENT)
+
+    for table, owner in reversed(OWNERS):
+        op.drop_index('ix_{0}_genre_genre_id_{0}_id'.format(owner), table_name='{}_genre'.format(owner))
+        op.drop_table('{}_genre'.format(owner))
+    op.drop_table('Genre')
@@ -0,0 +1,91 @@
+"""move city and state of venues and artists into a shared Area table
+
+Revision ID: f2b9d4e6a815
+Revises: e4a1c6b8d203
+Create Date: 2026-10-18 15:22:47.913560
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b9d4e6a815'
+down_revision = 'e4a1c6b8d203'
+branch_labels = None
+depends_on = None
+
+
+# must match Search in search.py for the planner to use the indexes
+NAME_DOCUMENT = "lower(name)"
+AREA_DOCUMENT = "lower(city || ' ' || state)"
+OLD_SEARCH_DOCUMENT = "lower(name || ' ' || city || ' ' || state)"
+
+OWNERS = (('Venue', 'venue'), ('Artist', 'artist'))
+
+
+def _create_search_index(name, table, document):
+    op.execute(
+        'CREATE INDEX {name} ON "{table}" USING gin (({document}) gin_trgm_ops)'
+        .format(name=name, table=table, document=document)
+    )
+
+
+def upgrade():
+    op.create_table('Area',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('city', sa.String(), nullable=False),
+    sa.Column('state', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('state', 'city', name='uq_area_state_city')
+    )
+
+    # one area per city and state, ignoring differences in case and spacing
+    # of the city; the first spelling in sort order names the area
+    op.execute(
+        'INSERT INTO "Area" (city, state) '
+        'SELECT min(city), state FROM ('
+        'SELECT regexp_replace(trim(city), \'\\s+\', \' \', \'g\') AS city, trim(state) AS state FROM "Venue" UNION ALL '
+        'SELECT regexp_replace(trim(city), \'\\s+\', \' \', \'g\') AS city, trim(state) AS state FROM "Artist"'
+        ') AS a GROUP BY lower(city), state'
+    )
+
+    for table, owner in OWNERS:
+        op.add_column(table, sa.Column('area_id', sa.Integer(), nullable=True))
+        op.execute(
+            'UPDATE "{table}" AS t SET area_id = a.id FROM "Area" AS a '
+            'WHERE a.state = trim(t.state) '
+            'AND lower(a.city) = lower(regexp_replace(trim(t.city), \'\\s+\', \' \', \'g\'))'
+            .format(table=table)
+        )
+        op.alter_column(table, 'area_id', nullable=False)
+        op.create_foreign_key('{}_area_id_fkey'.format(table), table, 'Area', ['area_id'], ['id'])
+        op.create_index('ix_{}_area_id_name'.format(owner), table, ['area_id', 'name'], unique=False)
+
+        op.execute('DROP INDEX ix_{}_search_trgm'.format(owner))
+        op.drop_column(table, 'city')
+        op.drop_column(table, 'state')
+        _create_search_index('ix_{}_name_trgm'.format(owner), table, NAME_DOCUMENT)
+
+    _create_search_index('ix_area_search_trgm', 'Area', AREA_DOCUMENT)
+
+
+def downgrade():
+    op.execute('DROP INDEX ix_area_search_trgm')
+    for table, owner in OWNERS:
+        op.execute('DROP INDEX ix_{}_name_trgm'.format(owner))
+        op.add_column(table, sa.Column('city', sa.String(), nullable=True))
+        op.add_column(table, sa.Column('state', sa.String(), nullable=True))
+        op.execute(
+            'UPDATE "{table}" AS t SET city = a.city, state = a.state FROM "Area" AS a '
+            'WHERE a.id = t.area_id'.format(table=table)
+        )
+        op.alter_column(table, 'city', nullable=False)
+        op.alter_column(table, 'state', nullable=False)
+        _create_search_index('ix_{}_search_trgm'.format(owner), table, OLD_SEARCH_DOCUMENT)
+
+        op.drop_index('ix_{}_area_id_name'.format(owner), table_name=table)
+        op.drop_constraint('{}_area_id_fkey'.format(table), table, type_='foreignkey')
+        op.drop_column(table, 'area_id')
+
+    op.drop_table('Area')
@@ -1,7 +1,17 @@
+import os
+import sys
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_moment import Moment
+from sqlalchemy import event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+# instrumentation.py at the top of the repository is shared with todoapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import Instrumentation
+from connection_pool import engine_options
+from loading import lazy_strategy, apply_load_profiles
+from replicas import RoutingSQLAlchemy
 
 #----------------------------------------------------------------------------#
 # App Config
@@ -10,61 +20,178 @@ from flask_moment import Moment
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+db = RoutingSQLAlchemy(app)
 migrate = Migrate(app, db)
+instrumentation = Instrumentation(app)
+apply_load_profiles(db.session)
+
+# loader of relationships a view did not declare with load_profile
+LAZY = lazy_strategy(app.config)
 
 #----------------------------------------------------------------------------#
 # Models
 #----------------------------------------------------------------------------#
 
-class Venue(db.Model):
-    __tablename__ = 'Venue'
+class utcnow(FunctionElement):
+    # the database clock in UTC, for last_modified: every writer, whichever
+    # host or session timezone it runs in, stamps rows from the same clock
+    type = db.DateTime()
+    inherit_cache = True
+
+@compiles(utcnow)
+def _utcnow(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'
+
+@compiles(utcnow, 'postgresql')
+def _utcnow_postgresql(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+@compiles(utcnow, 'sqlite')
+def _utcnow_sqlite(element, compiler, **kw):
+    # CURRENT_TIMESTAMP only has seconds
+    return "STRFTIME('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
+venue_genre = db.Table('venue_genre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_venue_genre_genre_id_venue_id', 'genre_id', 'venue_id')
+)
+
+artist_genre = db.Table('artist_genre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_artist_genre_genre_id_artist_id', 'genre_id', 'artist_id')
+)
+
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f'<Genre {self.id} {self.name}>'
+
+
+class Area(db.Model):
+    __tablename__ = 'Area'
+    __table_args__ = (
+        db.UniqueConstraint('state', 'city', name='uq_area_state_city'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
     city = db.Column(db.String(), nullable=False)
     state = db.Column(db.String(), nullable=False)
+
+    def __repr__(self):
+        return f'<Area {self.id} {self.city} {self.state}>'
+
+
+class AreaMixin(object):
+    # city and state of venues and artists live in the shared Area row
+
+    @property
+    def city(self):
+        return self.area.city
+
+    @property
+    def state(self):
+        return self.area.state
+
+
+class Venue(AreaMixin, db.Model):
+    __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_venue_area_id_name', 'area_id', 'name'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(), nullable=False, unique=True)
+    area_id = db.Column(db.Integer, db.ForeignKey('Area.id'), nullable=False)
     address = db.Column(db.String(), nullable=False)
     phone = db.Column(db.String())
-    genres = db.Column(db.String(), nullable=False)
     image_link = db.Column(db.String())
     facebook_link = db.Column(db.String())
     website_link = db.Column(db.String())
     looking_for_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String())
-    shows = db.relationship('Show', backref='venue', lazy=True)
+    upcoming_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_modified = db.Column(db.DateTime, nullable=False, index=True, default=utcnow(),
+      onupdate=utcnow(), server_default=utcnow())
+    area = db.relationship('Area', lazy='joined', innerjoin=True)
+    genres = db.relationship('Genre', secondary=venue_genre, order_by='Genre.name', lazy=LAZY)
+    shows = db.relationship('Show', backref=db.backref('venue', lazy=LAZY), lazy=LAZY)
 
     def __repr__(self):
-        return f'<Venue {self.id} {self.name} {self.genres}>'
+        return f'<Venue {self.id} {self.name} {self.city} {self.state}>'
 
 
-class Artist(db.Model):
+class Artist(AreaMixin, db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_artist_area_id_name', 'area_id', 'name'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(), nullable=False, unique=True)
-    city = db.Column(db.String(), nullable=False)
-    state = db.Column(db.String(), nullable=False)
+    area_id = db.Column(db.Integer, db.ForeignKey('Area.id'), nullable=False)
     phone = db.Column(db.String())
-    genres = db.Column(db.String(), nullable=False)
     image_link = db.Column(db.String())
     facebook_link = db.Column(db.String())
     website_link = db.Column(db.String())
     looking_for_venues = db.Column(db.Boolean)
     seeking_description = db.Column(db.String())
-    shows = db.relationship('Show', backref='artist', lazy=True)
+    upcoming_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_modified = db.Column(db.DateTime, nullable=False, index=True, default=utcnow(),
+      onupdate=utcnow(), server_default=utcnow())
+    area = db.relationship('Area', lazy='joined', innerjoin=True)
+    genres = db.relationship('Genre', secondary=artist_genre, order_by='Genre.name', lazy=LAZY)
+    shows = db.relationship('Show', backref=db.backref('artist', lazy=LAZY), lazy=LAZY)
 
     def __repr__(self):
-        return f'<Artist {self.id} {self.name} {self.genres}>'
+        return f'<Artist {self.id} {self.name} {self.city} {self.state}>'
 
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        # the keyset of the /shows listings
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     start_time = db.Column(db.DateTime, nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    last_modified = db.Column(db.DateTime, nullable=False, index=True, default=utcnow(),
+      onupdate=utcnow(), server_default=utcnow())
 
     def __repr__(self):
         return f'<Show {self.id} {self.artist_id} {self.venue_id} {self.start_time}>'
+
+
+class TableVersion(db.Model):
+    # one row per table, bumped whenever rows are deleted from it; deletes
+    # leave no last_modified behind for the conditional GETs to notice
+    __tablename__ = 'TableVersion'
+
+    name = db.Column(db.String(), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f'<TableVersion {self.name} {self.version}>'
+
+
+VERSIONED_TABLES = ('Venue', 'Artist', 'Show')
+
+@event.listens_for(TableVersion.__table__, 'after_create')
+def create_table_versions(target, connection, **kw):
+    # the rows bump_table_versions updates, also on db.create_all()
+    connection.execute(target.insert(), [{'name': name, 'version': 0} for name in VERSIONED_TABLES])
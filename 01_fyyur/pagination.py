@@ -0,0 +1,107 @@
+import base64
+import json
+from datetime import datetime
+from flask import request, abort
+from sqlalchemy import DateTime, tuple_
+from models import app
+
+#----------------------------------------------------------------------------#
+# Keyset Pagination
+#----------------------------------------------------------------------------#
+
+# Pages are addressed by the sort key of the row just before (or after) them
+# instead of an offset, so every page is a bounded index range scan no matter
+# how deep into the listing it is. The key columns must be unique together,
+# hence the id as last key column everywhere.
+
+# the query parameters every paginated view reads
+PAGE_PARAMS = ('after', 'before', 'per_page')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, keys):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode())
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise InvalidCursor(cursor)
+        return [datetime.fromisoformat(v) if isinstance(k.type, DateTime) else v
+          for k, v in zip(keys, values)]
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+def page_size():
+    # ?per_page= capped to MAX_PAGE_SIZE, falling back to PAGE_SIZE
+    per_page = request.args.get('per_page', app.config['PAGE_SIZE'], type=int)
+    return max(1, min(per_page, app.config['MAX_PAGE_SIZE']))
+
+
+class Page(object):
+
+    def __init__(self, items, keys, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.keys = keys
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def paginate(query, keys, after=None, before=None, per_page=None):
+    # keys are the labeled columns of query that make up the sort key; the
+    # key values are read back from each row by label to build the cursors
+    per_page = per_page or page_size()
+    key = tuple_(*keys)
+
+    if before is not None:
+        rows = query\
+          .filter(key < tuple_(*decode_cursor(before, keys)))\
+          .order_by(*[k.desc() for k in keys])\
+          .limit(per_page + 1).all()
+        more = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_prev, has_next = more, True
+    else:
+        if after is not None:
+            query = query.filter(key > tuple_(*decode_cursor(after, keys)))
+        rows = query.order_by(*keys).limit(per_page + 1).all()
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        has_prev, has_next = after is not None, more
+
+    def cursor(row):
+        return encode_cursor([getattr(row, k.key) for k in keys])
+
+    return Page(
+      rows,
+      keys,
+      per_page,
+      next_cursor=cursor(rows[-1]) if rows and has_next else None,
+      prev_cursor=cursor(rows[0]) if rows and has_prev else None
+    )
+
+def paginate_request(query, keys):
+    # paginate using the ?after= / ?before= cursors of the current request
+    try:
+        return paginate(query, keys,
+          after=request.args.get('after'),
+          before=request.args.get('before'))
+    except InvalidCursor:
+        abort(400, 'invalid page cursor')
@@ -0,0 +1,146 @@
+from itertools import groupby
+from sqlalchemy import func
+from models import db, Area, Venue, Artist, Show, Genre, venue_genre
+from pagination import paginate_request
+
+#----------------------------------------------------------------------------#
+# Genres
+#----------------------------------------------------------------------------#
+
+def genres_by_name(names):
+    # look up the Genre rows for a list of names, creating the missing ones
+    names = list(dict.fromkeys(n.strip() for n in names if n.strip()))
+    genres = {g.name: g for g in Genre.query.filter(Genre.name.in_(names))}
+    for name in names:
+        if name not in genres:
+            genres[name] = Genre(name=name)
+            db.session.add(genres[name])
+    return [genres[name] for name in names]
+
+def filter_by_genre(query, model, association, genre):
+    # restrict query to rows of model tagged with the genre named genre,
+    # served by the (genre_id, owner_id) index of the association table
+    if not genre:
+        return query
+    owner_id = association.c[model.__tablename__.lower() + '_id']
+    return query\
+      .join(association, owner_id == model.id)\
+      .join(Genre, Genre.id == association.c.genre_id)\
+      .filter(Genre.name == genre)
+
+#----------------------------------------------------------------------------#
+# Areas
+#----------------------------------------------------------------------------#
+
+def area_by_name(city, state):
+    # look up the Area row of a city and state, creating it if missing;
+    # cities differing only in case or spacing share one area
+    city = ' '.join(city.split())
+    area = Area.query\
+      .filter(Area.state == state, func.lower(Area.city) == city.lower())\
+      .first()
+    if area is None:
+        area = Area(city=city, state=state)
+        db.session.add(area)
+    return area
+
+def area_members(area_id, model):
+    # one page of the venues or artists of an area by name, served by the
+    # (area_id, name) index of the model's table
+    query = db.session.query(model.id, model.name, model.upcoming_show_count)\
+      .filter(model.area_id == area_id)
+    return paginate_request(query, [model.name, model.id])
+
+#----------------------------------------------------------------------------#
+# Venue Directory
+#----------------------------------------------------------------------------#
+
+def venue_directory(genre=None):
+    # build one page of the city/state -> venues -> upcoming show count tree
+    # from one query walking the areas in (state, city) order and each
+    # area's venues by name, reading the counters kept on Venue
+    query = db.session.query(
+        Area.id.label('area_id'),
+        Area.city,
+        Area.state,
+        Venue.id,
+        Venue.name,
+        Venue.upcoming_show_count.label('num_upcoming_shows')
+      )\
+      .join(Venue, Venue.area_id == Area.id)
+    query = filter_by_genre(query, Venue, venue_genre, genre)
+    page = paginate_request(query, [Area.state, Area.city, Venue.name, Venue.id])
+
+    data = []
+    for (area_id, city, state), venues in groupby(page.items, key=lambda r: (r.area_id, r.city, r.state)):
+        data.append({
+          'id': area_id,
+          'city': city,
+          'state': state,
+          'venues': [{
+            'id': v.id,
+            'name': v.name,
+            'num_upcoming_shows': v.num_upcoming_shows
+          } for v in venues]
+        })
+
+    return data, page
+
+#----------------------------------------------------------------------------#
+# Detail Pages
+#----------------------------------------------------------------------------#
+
+# A venue or artist page is served by one ordered query: the owner outer
+# joined to its shows and the other side of each show, with both show counts
+# as window aggregates over the same captured timestamp the rows are split
+# by. Genres come from a second, selectin query declared by the view's
+# load_profile.
+
+def _show_counts(now):
+    return (
+      func.count(Show.id).filter(Show.start_time <= now).over().label('past_shows_count'),
+      func.count(Show.id).filter(Show.start_time > now).over().label('upcoming_shows_count')
+    )
+
+def venue_shows_query(venue_id, now):
+    return db.session.query(
+        Venue,
+        Show.start_time,
+        Artist.id.label('artist_id'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        *_show_counts(now)
+      )\
+      .outerjoin(Show, Show.venue_id == Venue.id)\
+      .outerjoin(Artist, Artist.id == Show.artist_id)\
+      .filter(Venue.id == venue_id)\
+      .order_by(Show.start_time, Show.id)
+
+def artist_shows_query(artist_id, now):
+    return db.session.query(
+        Artist,
+        Show.start_time,
+        Venue.id.label('venue_id'),
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link'),
+        *_show_counts(now)
+      )\
+      .outerjoin(Show, Show.artist_id == Artist.id)\
+      .outerjoin(Venue, Venue.id == Show.venue_id)\
+      .filter(Artist.id == artist_id)\
+      .order_by(Show.start_time, Show.id)
+
+def split_shows(rows, now):
+    # partition start time ordered rows into past (most recent first) and
+    # upcoming (soonest first) shows; an owner without shows yields one row
+    # with no start time
+    past, upcoming = [], []
+    for row in rows:
+        if row.start_time is None:
+            continue
+        if row.start_time > now:
+            upcoming.append(row)
+        else:
+            past.append(row)
+    past.reverse()
+    return past, upcoming
@@ -0,0 +1,89 @@
+import json
+import click
+from datetime import datetime
+from sqlalchemy import func, text
+from models import app, db, Venue, Artist, Show
+from queries import venue_shows_query, artist_shows_query
+
+#----------------------------------------------------------------------------#
+# Query Plan Check
+#----------------------------------------------------------------------------#
+
+# Runs EXPLAIN on the queries every detail page, counter update and show
+# listing issues and warns when Postgres plans a sequential scan of a big
+# table for one of them, which usually means an index is missing or no longer
+# matches the query.
+# Runs from 'flask check-plans', and with CHECK_QUERY_PLANS before the first
+# request, never on import so migrations and other commands work against a
+# database that is down or not yet upgraded.
+
+def hot_queries(now=None):
+    now = now or datetime.now()
+    venue_id = db.session.query(func.min(Venue.id)).scalar() or 1
+    artist_id = db.session.query(func.min(Artist.id)).scalar() or 1
+    return {
+      'venue page': venue_shows_query(venue_id, now),
+      'artist page': artist_shows_query(artist_id, now),
+      'venue show count': db.session.query(func.count(Show.id))
+        .filter(Show.venue_id == venue_id, Show.start_time > now),
+      'artist show count': db.session.query(func.count(Show.id))
+        .filter(Show.artist_id == artist_id, Show.start_time > now),
+      'show listing': db.session.query(Show.id, Show.start_time)
+        .order_by(Show.start_time, Show.id).limit(app.config['PAGE_SIZE'] + 1),
+    }
+
+def _seq_scans(plan):
+    if plan.get('Node Type') == 'Seq Scan':
+        yield plan['Relation Name']
+    for child in plan.get('Plans', []):
+        yield from _seq_scans(child)
+
+def _row_estimates():
+    rows = db.session.execute(text(
+      "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'"))
+    return {name: count for name, count in rows}
+
+def check_query_plans(min_rows=None):
+    # returns {query name: [tables scanned sequentially]} for every hot query
+    # that scans a table estimated to hold at least min_rows rows
+    if db.engine.dialect.name != 'postgresql':
+        return {}
+    if min_rows is None:
+        min_rows = app.config.get('QUERY_PLAN_MIN_ROWS', 10000)
+
+    estimates = _row_estimates()
+    problems = {}
+    for name, query in hot_queries().items():
+        compiled = query.statement.compile(db.engine)
+        plan = db.session.connection()\
+          .exec_driver_sql('EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        scanned = [t for t in _seq_scans(plan[0]['Plan']) if estimates.get(t, 0) >= min_rows]
+        if scanned:
+            problems[name] = scanned
+            app.logger.warning('Query plan check: "%s" scans %s sequentially', name, ', '.join(scanned))
+    db.session.close()
+    return problems
+
+@app.before_first_request
+def check_query_plans_on_startup():
+    if not app.config.get('CHECK_QUERY_PLANS'):
+        return
+    try:
+        check_query_plans()
+    except Exception:
+        db.session.rollback()
+        db.session.close()
+        app.logger.warning('Query plan check failed', exc_info=True)
+
+@app.cli.command('check-plans')
+@click.option('--min-rows', type=int, help='Defaults to QUERY_PLAN_MIN_ROWS.')
+def check_plans_command(min_rows):
+    """Warn about hot queries planned with sequential scans of big tables."""
+    problems = check_query_plans(min_rows)
+    for name, tables in problems.items():
+        click.echo('{}: sequential scan of {}'.format(name, ', '.join(tables)))
+    if problems:
+        raise SystemExit(1)
+    click.echo('No sequential scans of big tables.')
@@ -0,0 +1,69 @@
+import random
+import time
+from functools import wraps
+from flask import g, has_request_context, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.sql.dml import UpdateBase
+
+#----------------------------------------------------------------------------#
+# Read Replicas
+#----------------------------------------------------------------------------#
+
+# Views decorated with read_only run their queries against one of the
+# replicas in SQLALCHEMY_REPLICA_URIS, everything else, and every flush or
+# bulk update, goes to the primary. A browser session that has just written
+# keeps reading from the primary for REPLICA_STICKY_SECONDS, so it sees its
+# own writes even when the replicas lag behind. The stickiness lives in the
+# session cookie, so all workers need the same SECRET_KEY.
+
+def replica_key(index):
+    return 'replica_{}'.format(index)
+
+
+class RoutingSession(SignallingSession):
+
+    def __init__(self, db, **options):
+        self._db = db
+        super(RoutingSession, self).__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase):
+            if has_request_context():
+                g.db_wrote = True
+        elif has_request_context() and g.get('read_replica'):
+            return self._db.get_engine(self.app, bind=g.read_replica)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def init_app(self, app):
+        for index, uri in enumerate(app.config.get('SQLALCHEMY_REPLICA_URIS', [])):
+            app.config.setdefault('SQLALCHEMY_BINDS', {})
+            app.config['SQLALCHEMY_BINDS'][replica_key(index)] = uri
+        super(RoutingSQLAlchemy, self).init_app(app)
+
+        @app.after_request
+        def stick_to_primary(response):
+            if g.get('db_wrote'):
+                session['primary_until'] = time.time() + app.config.get('REPLICA_STICKY_SECONDS', 10)
+            return response
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def read_only(self, f):
+        # route the queries of a view to a replica unless this browser
+        # session wrote recently
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            replicas = self.get_app().config.get('SQLALCHEMY_REPLICA_URIS', [])
+            if replicas and session.get('primary_until', 0) < time.time():
+                g.read_replica = replica_key(random.randrange(len(replicas)))
+            elif replicas:
+                # the response cache must not answer this session with a
+                # page rendered from a replica that may miss its writes
+                g.primary_pinned = True
+            return f(*args, **kwargs)
+        return wrapper
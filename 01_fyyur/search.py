@@ -0,0 +1,170 @@
+import heapq
+from collections import defaultdict
+from sqlalchemy import case, func, literal_column, select, union
+from models import app, db, Area, Venue, Artist, Genre, venue_genre, artist_genre
+
+#----------------------------------------------------------------------------#
+# Search
+#----------------------------------------------------------------------------#
+
+# On Postgres lower(name) is covered by a pg_trgm GIN index on both tables
+# (see migration f2b9d4e6a815), city and state through the same kind of index
+# on the small Area table, and genre names are matched through the Genre
+# table and the genre association indexes, so no part of the search scans
+# the whole table. Other databases, i.e. SQLite test runs, use an in-process
+# trigram index over name, city, state and genres instead.
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _rank(name, term):
+    # exact and prefix matches on the name first, then any other name match,
+    # then matches on city, state or genres only
+    if name.startswith(term):
+        return 0
+    if term in name:
+        return 1
+    return 2
+
+
+class InvertedIndex(object):
+    # maps every trigram of a document to the ids of the documents containing it
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.documents = {}
+
+    def add(self, id, name, document):
+        self.discard(id)
+        self.documents[id] = (name, document)
+        for trigram in _trigrams(document):
+            self.postings[trigram].add(id)
+
+    def discard(self, id):
+        if id not in self.documents:
+            return
+        name, document = self.documents.pop(id)
+        for trigram in _trigrams(document):
+            self.postings[trigram].discard(id)
+            if not self.postings[trigram]:
+                del self.postings[trigram]
+
+    def search(self, term, limit):
+        trigrams = _trigrams(term)
+        if trigrams:
+            postings = sorted((self.postings.get(t, set()) for t in trigrams), key=len)
+            candidates = set.intersection(*postings)
+        else:
+            # terms shorter than a trigram can only be matched by a scan
+            candidates = self.documents.keys()
+
+        matches = []
+        for id in candidates:
+            name, document = self.documents[id]
+            if term in document:
+                matches.append((_rank(name, term), name, id))
+        return [id for _, _, id in heapq.nsmallest(limit, matches)]
+
+
+class Search(object):
+
+    def __init__(self, model, association):
+        self.model = model
+        self.association = association
+        self._index = None
+
+    @property
+    def area_document(self):
+        space = literal_column("' '")
+        return func.lower(Area.city + space + Area.state)
+
+    @property
+    def owner_id(self):
+        return self.association.c[self.model.__tablename__.lower() + '_id']
+
+    def _use_index(self):
+        return db.engine.dialect.name != 'postgresql'
+
+    def _documents(self, id=None):
+        # (id, lower name, document) of every row, or only of the row with id
+        m = self.model
+        genres = defaultdict(list)
+        query = db.session.query(self.owner_id, func.lower(Genre.name))\
+          .join(Genre, Genre.id == self.association.c.genre_id)
+        rows = db.session.query(m.id, func.lower(m.name), self.area_document)\
+          .join(Area, Area.id == m.area_id)
+        if id is not None:
+            query = query.filter(self.owner_id == id)
+            rows = rows.filter(m.id == id)
+
+        for owner_id, name in query:
+            genres[owner_id].append(name)
+        for owner_id, name, area in rows:
+            yield owner_id, name, ' '.join([name, area] + genres[owner_id])
+
+    def _build_index(self):
+        index = InvertedIndex()
+        for id, name, document in self._documents():
+            index.add(id, name, document)
+        return index
+
+    def refresh(self, id):
+        # keep the in-process index in step with a committed insert or update,
+        # reading the row back rather than from possibly unloaded relationships
+        if self._index is not None:
+            for id, name, document in self._documents(int(id)):
+                self._index.add(id, name, document)
+
+    def discard(self, id):
+        if self._index is not None:
+            self._index.discard(int(id))
+
+    def query(self, term, *columns, limit=None):
+        # returns the given columns of the best limit matching rows, best
+        # matches first; limit defaults to PAGE_SIZE, so a short or common
+        # term does not load and render a large share of the catalog
+        m = self.model
+        term = term.strip().lower()
+        query = db.session.query(*columns)
+        limit = limit or app.config['PAGE_SIZE']
+
+        if self._use_index():
+            if self._index is None:
+                self._index = self._build_index()
+            ids = self._index.search(term, limit)
+            if not ids:
+                return []
+            position = {id: i for i, id in enumerate(ids)}
+            rows = query.add_columns(m.id.label('_search_id')).filter(m.id.in_(ids)).all()
+            return sorted(rows, key=lambda r: position[r._search_id])
+
+        pattern = _escape_like(term)
+        contains = '%' + pattern + '%'
+        matching_ids = union(
+          select([m.id.label('id')])
+            .where(func.lower(m.name).like(contains, escape='\\')),
+          select([m.id.label('id')])
+            .select_from(Area.__table__.join(m.__table__, m.area_id == Area.id))
+            .where(self.area_document.like(contains, escape='\\')),
+          select([self.owner_id.label('id')])
+            .select_from(self.association.join(Genre, Genre.id == self.association.c.genre_id))
+            .where(func.lower(Genre.name).like(contains, escape='\\'))
+        ).subquery()
+
+        name = func.lower(m.name)
+        rank = case(
+          [(name.like(pattern + '%', escape='\\'), 0),
+           (name.like(contains, escape='\\'), 1)],
+          else_=2
+        )
+        return query\
+          .join(matching_ids, matching_ids.c.id == m.id)\
+          .order_by(rank, name, m.id)\
+          .limit(limit).all()
+
+
+venue_search = Search(Venue, venue_genre)
+artist_search = Search(Artist, artist_genre)
@@ -0,0 +1,50 @@
+import os
+import sys
+import pytest
+from flask import Flask
+from sqlalchemy import exc, text
+from benchmark import load_app, seed
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import Instrumentation, assert_max_queries
+
+#----------------------------------------------------------------------------#
+# Query Counts
+#----------------------------------------------------------------------------#
+
+# Pins the number of statements the hot pages run on a seeded SQLite
+# database, so an added query per row (or per request) fails here before it
+# shows up in the benchmark. Run with: python -m pytest
+
+@pytest.fixture(scope='module')
+def fyyur(tmp_path_factory):
+    fyyur = load_app('sqlite:///' + str(tmp_path_factory.mktemp('fyyur') / 'test.db'))
+    seed(fyyur.db, venues=20, artists=20, shows=200)
+    return fyyur
+
+@pytest.fixture
+def client(fyyur):
+    return fyyur.app.test_client()
+
+
+@pytest.mark.parametrize('url, max_queries', [
+  # validator state, page
+  ('/venues', 2),
+  ('/shows', 2),
+  # validator state, venue with its shows, genres
+  ('/venues/1', 3),
+])
+def test_page_query_count(client, url, max_queries):
+    response = assert_max_queries(client, url, max_queries)
+    assert response.status_code == 200
+
+def test_assert_max_queries_fails_above_the_limit(client):
+    with pytest.raises(AssertionError, match='/venues/1 ran 3 queries'):
+        assert_max_queries(client, '/venues/1', 2)
+
+def test_failed_statement_is_not_left_on_the_timing_stack(fyyur):
+    app = Flask(__name__)
+    Instrumentation(app)
+    with fyyur.db.engine.connect() as conn:
+        with pytest.raises(exc.OperationalError):
+            conn.execute(text('SELECT * FROM no_such_table'))
+        assert conn.info.get('query_start') == []
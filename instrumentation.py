@@ -0,0 +1,126 @@
+import heapq
+import time
+from contextlib import contextmanager
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Query Instrumentation
+#----------------------------------------------------------------------------#
+
+# Counts and times every statement executed while handling a request, adds a
+# Server-Timing header with the totals and logs requests that run too many
+# or too slow queries together with their slowest statements.
+#
+# Config (all optional):
+#   INSTRUMENT_QUERIES       turn the instrumentation on, default True
+#   SLOW_REQUEST_MS          log requests slower than this, default 500
+#   SLOW_REQUEST_DB_MS       log requests spending longer in the db, default 200
+#   SLOW_REQUEST_QUERIES     log requests running more statements, default 20
+#   SLOW_QUERY_LOG_COUNT     slowest statements logged per request, default 5
+
+
+class QueryStats(object):
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.duration = 0.0
+        self.statements = []
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.statements.append((duration, statement))
+
+    def slowest(self, n):
+        return heapq.nlargest(n, self.statements, key=lambda s: s[0])
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+    if context is not None:
+        context.query_timed = True
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start'].pop()
+    if context is not None:
+        context.query_timed = False
+    if has_app_context() and 'query_stats' in g:
+        g.query_stats.record(statement, duration)
+
+def _handle_error(context):
+    # a failed statement never reaches after_cursor_execute, drop its start
+    # time so the next statement on the connection is not timed against it
+    if getattr(context.execution_context, 'query_timed', False):
+        context.execution_context.query_timed = False
+        context.connection.info['query_start'].pop()
+
+
+class Instrumentation(object):
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('INSTRUMENT_QUERIES', True):
+            return
+        # listening on the Engine class covers every engine the app creates
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        self.app = app
+
+    def _start(self):
+        g.query_stats = QueryStats()
+
+    def _finish(self, response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        elapsed = stats.elapsed()
+        response.headers.add('Server-Timing', 'db;dur={:.1f};desc="{} queries", total;dur={:.1f}'
+          .format(stats.duration * 1000, stats.count, elapsed * 1000))
+
+        config = self.app.config
+        if (elapsed * 1000 > config.get('SLOW_REQUEST_MS', 500)
+            or stats.duration * 1000 > config.get('SLOW_REQUEST_DB_MS', 200)
+            or stats.count > config.get('SLOW_REQUEST_QUERIES', 20)):
+            self.app.logger.warning('Slow request %s %s: %.1fms, %d queries, %.1fms in db',
+              request.method, request.full_path, elapsed * 1000, stats.count, stats.duration * 1000)
+            for duration, statement in stats.slowest(config.get('SLOW_QUERY_LOG_COUNT', 5)):
+                self.app.logger.warning('  %.1fms %s', duration * 1000, ' '.join(statement.split()))
+        return response
+
+#----------------------------------------------------------------------------#
+# Test Helpers
+#----------------------------------------------------------------------------#
+
+@contextmanager
+def count_queries():
+    # collects the statements executed inside the block
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+
+def assert_max_queries(client, url, max_queries, method='GET', **kwargs):
+    # request url with a test client and fail if it ran more than
+    # max_queries statements, e.g. assert_max_queries(app.test_client(), '/venues', 2)
+    with count_queries() as statements:
+        response = client.open(url, method=method, **kwargs)
+    assert len(statements) <= max_queries, '{} {} ran {} queries, expected at most {}:\n{}'.format(
+      method, url, len(statements), max_queries, '\n'.join(statements))
+    return response
@@ -1,14 +1,26 @@
-from flask import Flask, render_template, request, redirect, url_for, abort, jsonify
+from collections import Counter, defaultdict
+from flask import Flask, render_template, request, redirect, url_for, abort, jsonify, Response, \
+  stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from events import EventBroker
+import os
 import sys
 
+# instrumentation.py at the top of the repository is shared with 01_fyyur
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import Instrumentation
+
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///todoapp'
+# todos rendered with a list and fetched per infinite scroll request
+app.config['TODOS_PAGE_SIZE'] = 100
 db = SQLAlchemy(app)
 
 migrate = Migrate(app, db)
+instrumentation = Instrumentation(app)
+broker = EventBroker(app, db)
 
 
 class TodoList(db.Model):
@@ -20,6 +32,12 @@ class TodoList(db.Model):
 
 class Todo(db.Model):
     __tablename__ = 'todos'
+    __table_args__ = (
+        db.Index('ix_todos_list_id_id', 'list_id', 'id'),
+        db.Index('ix_todos_open_list_id_id', 'list_id', 'id',
+            postgresql_where=db.text('NOT completed'),
+            postgresql_include=['description']),
+    )
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(), nullable=False)
     completed = db.Column(db.Boolean, nullable=False, default= False, server_default='FALSE')
@@ -29,16 +47,44 @@ class Todo(db.Model):
         return f'<Todo {self.id} {self.description}>'
 
 
+def insert_todos(rows):
+    # insert todos from dicts of description and list_id with one multi-row
+    # INSERT, returning their ids in the order given
+    if not rows:
+        return []
+    result = db.session.execute(db.insert(Todo).values(rows).returning(Todo.id))
+    return [id for id, in result]
+
+
+def publish_by_list(rows, delta):
+    # publish delta once per list with the ids of the (id, list_id) rows in it
+    ids = defaultdict(list)
+    for id, list_id in rows:
+        ids[list_id].append(id)
+    for list_id in ids:
+        broker.publish(list_id, dict(delta, ids=ids[list_id]))
+
+
 @app.route('/todos/create', methods=['POST'])
 def create_todo():
+    # creates one todo per non-empty line of description, so a pasted
+    # checklist is inserted with a single statement
+    body = request.get_json()
+    list_id = body.get('list_id') if isinstance(body, dict) else None
+    description = body.get('description') if isinstance(body, dict) else None
+    if not isinstance(list_id, int) or not isinstance(description, str):
+        abort(400)
+    descriptions = [line.strip() for line in description.splitlines() if line.strip()]
+    if not descriptions:
+        abort(400)
+
     error = False
-    body = {}
+    todos = []
     try:
-        description = request.get_json()['description']
-        todo = Todo(description=description)
-        db.session.add(todo)
+        ids = insert_todos([{'description': d, 'list_id': list_id} for d in descriptions])
+        todos = [{'id': id, 'description': d, 'completed': False} for id, d in zip(ids, descriptions)]
+        broker.publish(list_id, {'type': 'created', 'todos': todos})
         db.session.commit()
-        body['description'] = todo.description
     except:
         error = True
         db.session.rollback()
@@ -49,7 +95,7 @@ def create_todo():
     if error:
         abort(400)
     else:
-        return jsonify(body)
+        return jsonify({'todos': todos})
 
 
 @app.route('/todos/<todo_id>/set-completed', methods=['POST'])
@@ -58,6 +104,7 @@ def set_completed_todo(todo_id):
         completed = request.get_json()['completed']
         todo = Todo.query.get(todo_id)
         todo.completed = completed
+        broker.publish(todo.list_id, {'type': 'completed', 'ids': [todo.id], 'completed': completed})
         db.session.commit()
     except:
         db.session.rollback()
@@ -70,7 +117,10 @@ def set_completed_todo(todo_id):
 @app.route('/todos/<todo_id>', methods=['DELETE'])
 def delete_todo(todo_id):
   try:
-    Todo.query.filter_by(id=todo_id).delete()
+    deleted = db.session.execute(db.delete(Todo)
+      .where(Todo.id == todo_id)
+      .returning(Todo.id, Todo.list_id))
+    publish_by_list(deleted, {'type': 'deleted'})
     db.session.commit()
   except:
     db.session.rollback()
@@ -80,12 +130,230 @@ def delete_todo(todo_id):
   return jsonify({ 'success': True })
 
 
-@app.route('/lists/<list_id>')
-def get_list_todos(list_id):
+BATCH_OPERATIONS = ('create', 'complete', 'delete')
+
+
+def parse_operation(operation):
+    # validate one operation of a batch, returns an error message or None
+    if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPERATIONS:
+        return 'op must be one of ' + ', '.join(BATCH_OPERATIONS)
+    if operation['op'] == 'create':
+        if not isinstance(operation.get('description'), str) or not operation['description'].strip():
+            return 'description is required'
+        if not isinstance(operation.get('list_id'), int):
+            return 'list_id is required'
+    elif operation['op'] == 'complete' and 'id' not in operation:
+        # every todo of a list at once
+        if not isinstance(operation.get('list_id'), int):
+            return 'id or list_id is required'
+    elif not isinstance(operation.get('id'), int):
+        return 'id is required'
+    if operation['op'] == 'complete' and not isinstance(operation.get('completed', True), bool):
+        return 'completed must be true or false'
+    return None
+
+
+def operation_target(operation):
+    # the todo, or for a list-scoped complete the list, an operation changes
+    if operation['op'] == 'create':
+        return None
+    if 'id' in operation:
+        return ('todo', operation['id'])
+    return ('list', operation['list_id'])
+
+
+@app.route('/todos/batch', methods=['POST'])
+def batch_todos():
+    # apply a JSON array of create, complete and delete operations in one
+    # transaction: one INSERT for all creates, one UPDATE ... WHERE list_id
+    # per list-scoped complete, one UPDATE ... WHERE id IN per completed
+    # value and one DELETE ... WHERE id IN. A complete with list_id instead
+    # of id marks every todo of the list, so "mark all complete" is a single
+    # statement however many todos the list has
+    operations = request.get_json()
+    if not isinstance(operations, list):
+        abort(400)
+
+    # operations are grouped by kind rather than applied in array order, so
+    # several operations on one todo (or list) would have no well-defined
+    # outcome; list-scoped completes are applied before those by id
+    errors = [parse_operation(operation) for operation in operations]
+    targets = [None if error else operation_target(operation)
+               for operation, error in zip(operations, errors)]
+    touched = Counter(target for target in targets if target)
+    for i, target in enumerate(targets):
+        if target and touched[target] > 1:
+            errors[i] = '{} {} appears in more than one operation'.format(*target)
+
+    # unknown lists would fail the foreign key of the INSERT and roll back
+    # every operation, so they are looked up first with one query
+    list_ids = {operation['list_id'] for operation, error in zip(operations, errors)
+                if not error and 'list_id' in operation}
+    known = {id for id, in db.session.query(TodoList.id).filter(TodoList.id.in_(list_ids))} \
+        if list_ids else set()
+    for i, operation in enumerate(operations):
+        if not errors[i] and 'list_id' in operation and operation['list_id'] not in known:
+            errors[i] = 'list {} does not exist'.format(operation['list_id'])
+
+    results = [None] * len(operations)
+    creates, list_completes, completes, deletes = [], [], {True: [], False: []}, []
+    for i, operation in enumerate(operations):
+        if errors[i]:
+            results[i] = {'success': False, 'error': errors[i]}
+        elif operation['op'] == 'create':
+            creates.append(i)
+        elif operation['op'] == 'complete' and targets[i][0] == 'list':
+            list_completes.append(i)
+        elif operation['op'] == 'complete':
+            completes[operation.get('completed', True)].append(i)
+        else:
+            deletes.append(i)
+
+    error = False
+    try:
+        ids = insert_todos([{
+            'description': operations[i]['description'].strip(),
+            'list_id': operations[i]['list_id']
+        } for i in creates])
+        created = defaultdict(list)
+        for i, id in zip(creates, ids):
+            results[i] = {'success': True, 'id': id}
+            created[operations[i]['list_id']].append({
+              'id': id,
+              'description': operations[i]['description'].strip(),
+              'completed': False
+            })
+        for list_id in created:
+            broker.publish(list_id, {'type': 'created', 'todos': created[list_id]})
+
+        for i in list_completes:
+            completed = operations[i].get('completed', True)
+            # only the todos that change, so they are all the delta carries
+            rows = db.session.execute(db.update(Todo)
+              .where(Todo.list_id == operations[i]['list_id'], Todo.completed != completed)
+              .values(completed=completed)
+              .returning(Todo.id, Todo.list_id)).all()
+            publish_by_list(rows, {'type': 'completed', 'completed': completed})
+            results[i] = {'success': True, 'updated': len(rows)}
+
+        for completed, indexes in completes.items():
+            if not indexes:
+                continue
+            rows = db.session.execute(db.update(Todo)
+              .where(Todo.id.in_([operations[i]['id'] for i in indexes]))
+              .values(completed=completed)
+              .returning(Todo.id, Todo.list_id)).all()
+            publish_by_list(rows, {'type': 'completed', 'completed': completed})
+            updated = {id for id, list_id in rows}
+            for i in indexes:
+                results[i] = {'success': operations[i]['id'] in updated}
+
+        if deletes:
+            rows = db.session.execute(db.delete(Todo)
+              .where(Todo.id.in_([operations[i]['id'] for i in deletes]))
+              .returning(Todo.id, Todo.list_id)).all()
+            publish_by_list(rows, {'type': 'deleted'})
+            deleted = {id for id, list_id in rows}
+            for i in deletes:
+                results[i] = {'success': operations[i]['id'] in deleted}
+
+        db.session.commit()
+    except:
+        error = True
+        db.session.rollback()
+        print(sys.exc_info())
+    finally:
+        db.session.close()
+
+    if error:
+        abort(400)
+    else:
+        return jsonify({'success': True, 'results': results})
+
+
+def list_summaries():
+    # every list with its todo and completed counts, from one aggregate query
+    return db.session.query(
+        TodoList.id,
+        TodoList.name,
+        db.func.count(Todo.id).label('todo_count'),
+        db.func.count(Todo.id).filter(Todo.completed).label('completed_count')
+      )\
+      .outerjoin(Todo, Todo.list_id == TodoList.id)\
+      .group_by(TodoList.id, TodoList.name)\
+      .order_by(TodoList.id)\
+      .all()
+
+
+def todos_page(list_id, after=None, open_only=False):
+    # the next page of a list's todos in id order, starting after the todo
+    # with id after; returns the todos and the cursor of the following page
+    limit = app.config['TODOS_PAGE_SIZE']
+    if open_only:
+        # only columns of the partial index of open todos, so Postgres
+        # answers it with an index-only scan
+        query = db.session.query(Todo.id, Todo.description, db.literal(False).label('completed'))\
+          .filter(Todo.list_id == list_id, db.not_(Todo.completed))
+    else:
+        query = Todo.query.filter(Todo.list_id == list_id)
+    if after is not None:
+        query = query.filter(Todo.id > after)
+    todos = query.order_by(Todo.id).limit(limit + 1).all()
+    next_after = todos[limit - 1].id if len(todos) > limit else None
+    return todos[:limit], next_after
+
+
+def todo_json(todo):
+    return {
+        'id': todo.id,
+        'description': todo.description,
+        'completed': todo.completed
+    }
+
+
+def render_list(list_id, open_only=False):
+    lists = list_summaries()
+    active_list = next((l for l in lists if l.id == list_id), None)
+    if active_list is None:
+        abort(404)
+    todos, next_after = todos_page(list_id, open_only=open_only)
     return render_template('index.html',
-    lists=TodoList.query.all(),
-    active_list=TodoList.query.get(list_id),
-    todos=Todo.query.filter_by(list_id=list_id).order_by('id').all())
+    lists=lists,
+    active_list=active_list,
+    todos=todos,
+    next_after=next_after,
+    open_only=open_only)
+
+
+@app.route('/lists/<int:list_id>')
+def get_list_todos(list_id):
+    return render_list(list_id)
+
+
+@app.route('/lists/<int:list_id>/open')
+def get_list_open_todos(list_id):
+    # what is left to do on a list
+    return render_list(list_id, open_only=True)
+
+
+@app.route('/lists/<int:list_id>/todos')
+def get_list_todos_page(list_id):
+    # JSON page of todos for infinite scroll, ?after=<id of the last todo
+    # shown> and ?open=1 for open todos only
+    todos, next_after = todos_page(list_id, request.args.get('after', type=int),
+        open_only=bool(request.args.get('open', type=int)))
+    return jsonify({
+        'todos': [todo_json(todo) for todo in todos],
+        'next': next_after
+    })
+
+
+@app.route('/lists/<int:list_id>/events')
+def get_list_events(list_id):
+    # server-sent events with the changes to a list, see events.py
+    return Response(stream_with_context(broker.stream(list_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/')
@@ -0,0 +1,146 @@
+import json
+import queue
+import select
+import threading
+import time
+from sqlalchemy import event, func, select as sql_select
+
+#----------------------------------------------------------------------------#
+# Todo Events
+#----------------------------------------------------------------------------#
+
+# Publishes the changes made to a list as small deltas and streams them to
+# the open pages of that list as server-sent events, so pages update in
+# place instead of being reloaded.
+#
+# A delta published inside a transaction is only delivered once it commits.
+# On Postgres deltas go through NOTIFY, so every app process receives them
+# from its LISTEN connection; elsewhere they are delivered to the
+# subscribers of this process after the commit.
+#
+# Config (all optional):
+#   EVENTS_KEEPALIVE_SECONDS   comment sent on idle streams, default 15
+#   EVENTS_QUEUE_SIZE          deltas buffered per slow client, default 1000
+
+CHANNEL = 'todo_events'
+# NOTIFY payloads must stay below 8000 bytes
+MAX_PAYLOAD = 7000
+
+
+def _payloads(message):
+    # split a delta into NOTIFY sized messages of the same type
+    payload = json.dumps(message, separators=(',', ':'))
+    key = 'todos' if 'todos' in message else 'ids'
+    items = message[key]
+    if len(payload) <= MAX_PAYLOAD or len(items) < 2:
+        return [payload]
+    half = len(items) // 2
+    return _payloads(dict(message, **{key: items[:half]})) + \
+        _payloads(dict(message, **{key: items[half:]}))
+
+
+class EventBroker(object):
+
+    def __init__(self, app=None, db=None):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._listener = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+
+        @event.listens_for(db.session, 'after_commit')
+        def deliver_pending(session):
+            for message in session.info.pop('pending_events', []):
+                self._deliver(message)
+
+        @event.listens_for(db.session, 'after_rollback')
+        def drop_pending(session):
+            session.info.pop('pending_events', None)
+
+    def _use_notify(self):
+        return self.db.engine.dialect.name == 'postgresql'
+
+    def publish(self, list_id, delta):
+        # deltas: {'type': 'created', 'todos': [...]},
+        # {'type': 'completed', 'ids': [...], 'completed': bool} and
+        # {'type': 'deleted', 'ids': [...]}
+        message = dict(delta, list_id=list_id)
+        if self._use_notify():
+            for payload in _payloads(message):
+                self.db.session.execute(sql_select(func.pg_notify(CHANNEL, payload)))
+        else:
+            self.db.session.info.setdefault('pending_events', []).append(message)
+
+    def _deliver(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(message['list_id'], ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # a client this far behind reloads the list instead
+                pass
+
+    def subscribe(self, list_id):
+        if self._use_notify():
+            self._start_listener()
+        subscriber = queue.Queue(self.app.config.get('EVENTS_QUEUE_SIZE', 1000))
+        with self._lock:
+            self._subscribers.setdefault(list_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, list_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(list_id, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self._subscribers.pop(list_id, None)
+
+    def stream(self, list_id):
+        # server-sent events of a list until the client goes away
+        subscriber = self.subscribe(list_id)
+        keepalive = self.app.config.get('EVENTS_KEEPALIVE_SECONDS', 15)
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    message = subscriber.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield 'data: {}\n\n'.format(json.dumps(message, separators=(',', ':')))
+        finally:
+            self.unsubscribe(list_id, subscriber)
+
+    def _start_listener(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(target=self._listen, name='todo-events', daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        # one LISTEN connection per process, reconnecting after errors
+        while True:
+            connection = None
+            try:
+                connection = self.db.engine.raw_connection()
+                connection.connection.autocommit = True
+                connection.cursor().execute('LISTEN ' + CHANNEL)
+                driver = connection.connection
+                while True:
+                    if select.select([driver], [], [], 60) == ([], [], []):
+                        continue
+                    driver.poll()
+                    while driver.notifies:
+                        self._deliver(json.loads(driver.notifies.pop(0).payload))
+            except Exception:
+                self.app.logger.exception('todo events listener failed, reconnecting')
+                time.sleep(1)
+            finally:
+                if connection is not None:
+                    connection.invalidate()
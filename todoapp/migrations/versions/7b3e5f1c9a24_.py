@@ -0,0 +1,30 @@
+"""index todos by list and id, and the open todos of a list separately
+
+Revision ID: 7b3e5f1c9a24
+Revises: c427b554badb
+Create Date: 2026-10-18 18:04:12.530117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3e5f1c9a24'
+down_revision = 'c427b554badb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_todos_list_id_id', 'todos', ['list_id', 'id'], unique=False)
+    # only the open todos, carrying their description so the open items of
+    # a list are read by an index-only scan
+    op.create_index('ix_todos_open_list_id_id', 'todos', ['list_id', 'id'], unique=False,
+        postgresql_where=sa.text('NOT completed'),
+        postgresql_include=['description'])
+
+
+def downgrade():
+    op.drop_index('ix_todos_open_list_id_id', table_name='todos')
+    op.drop_index('ix_todos_list_id_id', table_name='todos')